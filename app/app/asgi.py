@@ -9,8 +9,13 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+
+from core.handlers import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
 
-application = get_asgi_application()
+# Like get_asgi_application(), with streaming bodies read off the loop.
+django.setup(set_prefix=False)
+application = ASGIHandler()
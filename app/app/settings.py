@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'core',
     'rest_framework',
@@ -60,6 +61,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -90,13 +92,85 @@ WSGI_APPLICATION = 'app.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': bool(
+            int(os.environ.get('DB_CONN_HEALTH_CHECKS', 1)),
+        ),
     }
 }
+if bool(int(os.environ.get('DB_POOL', 0))):
+    # Connections go back to the pool of the process after each request.
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['POOL'] = {
+        'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+    }
+
+# Read replicas as comma separated host[:port], e.g. DB_REPLICA_HOSTS=db2.
+# A lagging replica can be simulated locally with a streaming standby
+# started with recovery_min_apply_delay.
+DATABASE_REPLICAS = []
+for index, address in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')),
+):
+    host, _, port = address.partition(':')
+    alias = f'replica{index + 1}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.db.routers.ReplicaRouter']
+
+# Seconds a client reads from the primary after sending a write.
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+# Cache holding the pins, it must be shared by all workers.
+REPLICA_PIN_CACHE = 'replica_pin'
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'default'),
+    },
+    'auth': {
+        'BACKEND': os.environ.get(
+            'AUTH_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('AUTH_CACHE_LOCATION', 'auth'),
+        'TIMEOUT': int(os.environ.get('AUTH_CACHE_TIMEOUT', 300)),
+    },
+    'replica_pin': {
+        'BACKEND': os.environ.get(
+            'REPLICA_PIN_CACHE_BACKEND',
+            'django.core.cache.backends.db.DatabaseCache',
+        ),
+        'LOCATION': os.environ.get(
+            'REPLICA_PIN_CACHE_LOCATION', 'replica_pin_cache',
+        ),
+    },
+}
+if CACHES['auth']['BACKEND'].endswith('LocMemCache'):
+    CACHES['auth']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', 10000)),
+    }
+
+AUTH_TOKEN_CACHE = 'auth'
 
 
 # Password validation
@@ -141,6 +215,10 @@ MEDIA_URL = '/static/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+FILE_UPLOAD_HANDLERS = [
+    'core.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -150,8 +228,39 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'core.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser',
+        'core.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 100))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 500))
+RECIPE_BULK_MAX_SIZE = int(os.environ.get('RECIPE_BULK_MAX_SIZE', 100))
+AUTOCOMPLETE_PAGE_SIZE = int(os.environ.get('AUTOCOMPLETE_PAGE_SIZE', 10))
+
+RECIPE_IMAGE_VARIANTS = {
+    'thumb': 160,
+    'medium': 640,
+    'large': 1280,
+}
+IMAGE_VARIANT_QUALITY = int(os.environ.get('IMAGE_VARIANT_QUALITY', 80))
+IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', 2))
+
+# Serve list and retrieve as async views, set by the ASGI entry point.
+ASYNC_READ_VIEWS = bool(int(os.environ.get('ASYNC_READ_VIEWS', 0)))
+
+# Bearer token for scraping /api/metrics/, which staff can also read.
+# Each scrape returns the metrics of one worker, labelled with its pid.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
@@ -22,12 +22,13 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
-from core.views import health_check
+from core.views import health_check, metrics
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/health-check/', health_check, name='health-check'),
+    path('api/metrics/', metrics, name='metrics'),
     path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
     path(
         'api/docs/',
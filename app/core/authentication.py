@@ -0,0 +1,49 @@
+"""
+Authentication for the APIs.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_framework.authentication import TokenAuthentication
+
+from core.db.routers import primary_reads
+
+
+def token_cache_key(key):
+    """Return the cache key for an auth token."""
+    return f'auth-token:{key}'
+
+
+def get_token_cache():
+    """Return the cache holding resolved auth tokens."""
+    return caches[settings.AUTH_TOKEN_CACHE]
+
+
+def invalidate_tokens(keys):
+    """Drop the cached resolution of the given auth tokens."""
+    get_token_cache().delete_many([token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that caches the token and its user.
+
+    Entries expire after the timeout of the auth cache and are dropped
+    when the token is deleted or its user is saved. With an in-process
+    cache only the current worker is invalidated immediately, so use a
+    shared cache backend when a deactivation must apply everywhere at
+    once.
+    """
+
+    def authenticate_credentials(self, key):
+        """Return the user and token for key, from the cache if possible."""
+        cache = get_token_cache()
+        cache_key = token_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            # A replica may still hold a deleted token or inactive user.
+            with primary_reads():
+                user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, token)
+
+        return (token.user, token)
@@ -0,0 +1,95 @@
+"""
+Metrics of the database connections of this process.
+
+Every sample carries the pid, so the workers behind one address show up
+as separate series rather than as counter resets.
+"""
+import bisect
+import os
+import threading
+
+from core.db.pool import get_pools
+
+# Upper bounds in seconds of the connection acquire latency histogram.
+ACQUIRE_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1,
+    2.5, 5,
+)
+
+POOL_METRICS = [
+    ('db_pool_max_size', 'gauge', 'Connections the pool may open.',
+     'max_size'),
+    ('db_pool_in_use', 'gauge', 'Connections checked out of the pool.',
+     'in_use'),
+    ('db_pool_idle', 'gauge', 'Open connections waiting in the pool.',
+     'idle'),
+    ('db_pool_waiting', 'gauge', 'Threads waiting for a connection.',
+     'waiting'),
+    ('db_pool_timeouts_total', 'counter',
+     'Acquires that gave up with every connection in use.', 'timeouts'),
+]
+
+_acquire = {}
+_lock = threading.Lock()
+
+
+class Histogram:
+    """Counts of observations under each bucket bound, with their sum."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        """Count one observation."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        """Return the Prometheus samples of the histogram."""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}',
+            )
+        lines += [
+            f'{name}_sum{{{labels}}} {self.sum}',
+            f'{name}_count{{{labels}}} {cumulative}',
+        ]
+        return lines
+
+
+def observe_acquire(alias, seconds):
+    """Record the time taken to get a connection for the alias."""
+    with _lock:
+        if alias not in _acquire:
+            _acquire[alias] = Histogram(ACQUIRE_BUCKETS)
+        _acquire[alias].observe(seconds)
+
+
+def render_metrics():
+    """Return the metrics in the Prometheus text format."""
+    lines = [
+        '# HELP db_connection_acquire_seconds Time taken to open or check '
+        'out a database connection.',
+        '# TYPE db_connection_acquire_seconds histogram',
+    ]
+    pid = os.getpid()
+    with _lock:
+        for alias, histogram in sorted(_acquire.items()):
+            lines += histogram.samples(
+                'db_connection_acquire_seconds',
+                f'alias="{alias}",pid="{pid}"',
+            )
+
+    pools = sorted(get_pools().items())
+    for name, kind, description, attr in POOL_METRICS:
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        lines += [
+            f'{name}{{alias="{alias}",pid="{pid}"}} {getattr(pool, attr)}'
+            for alias, pool in pools
+        ]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,121 @@
+"""
+Database connection pool shared by the threads of a process.
+"""
+import os
+import threading
+
+from psycopg2 import Error, OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    A bounded set of connections, handed out to one thread at a time.
+
+    Idle connections are reused newest first. When all of them are in use
+    acquire() waits up to the timeout for one to be released.
+    """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.in_use = 0
+        self.waiting = 0
+        self.timeouts = 0
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    @property
+    def idle(self):
+        """Number of open connections waiting to be acquired."""
+        return len(self._idle)
+
+    def acquire(self, connect, check=None):
+        """Return an idle connection or a new one from connect()."""
+        with self._lock:
+            self.waiting += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        if not acquired:
+            with self._lock:
+                self.timeouts += 1
+            raise OperationalError(
+                f'No database connection free after {self.timeout}s, all '
+                f'{self.max_size} are in use.'
+            )
+
+        with self._lock:
+            self.in_use += 1
+            connection = self._idle.pop() if self._idle else None
+        try:
+            if connection is not None and (
+                connection.closed or (check and not check(connection))
+            ):
+                connection.close()
+                connection = None
+            if connection is None:
+                connection = connect()
+        except BaseException:
+            self._release_slot()
+            raise
+        return connection
+
+    def release(self, connection):
+        """Take back a connection, rolling back an open transaction."""
+        try:
+            if (
+                not connection.closed and
+                connection.info.transaction_status != TRANSACTION_STATUS_IDLE
+            ):
+                connection.rollback()
+        except Error:
+            connection.close()
+        finally:
+            if not connection.closed:
+                with self._lock:
+                    self._idle.append(connection)
+            self._release_slot()
+
+    def close(self):
+        """Close the idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def _release_slot(self):
+        """Free the slot of a connection handed out."""
+        with self._lock:
+            self.in_use -= 1
+        self._slots.release()
+
+
+def get_pool(alias, options):
+    """Return the pool of the database alias in this process."""
+    key = (os.getpid(), alias)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            # Connections are not shared with processes forked from here.
+            pool = _pools[key] = ConnectionPool(
+                max_size=options.get('MAX_SIZE', 10),
+                timeout=options.get('TIMEOUT', 5),
+            )
+        return pool
+
+
+def get_pools():
+    """Return the pools of this process by database alias."""
+    pid = os.getpid()
+    with _pools_lock:
+        return {
+            alias: pool for (owner, alias), pool in _pools.items()
+            if owner == pid
+        }
@@ -0,0 +1,98 @@
+"""
+PostgreSQL backend with connection health checks and an optional pool.
+"""
+import time
+
+from django.db.backends.postgresql import base
+
+from core.db.metrics import observe_acquire
+from core.db.pool import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Check reused connections and optionally borrow them from a pool.
+
+    CONN_HEALTH_CHECKS backports the Django 4.1 setting: a persistent
+    connection is tested before its first query in each request and
+    replaced if the server dropped it. With POOL, connections come from
+    a pool shared by the threads of the process and go back to it when
+    Django closes them.
+    """
+    health_check_done = False
+
+    @property
+    def health_check_enabled(self):
+        """Whether reused connections are checked before use."""
+        return self.settings_dict.get('CONN_HEALTH_CHECKS', False)
+
+    @property
+    def pool(self):
+        """Return the connection pool of the database, or None."""
+        options = self.settings_dict.get('POOL')
+        if options is None:
+            return None
+        return get_pool(self.alias, options)
+
+    def get_new_connection(self, conn_params):
+        """Open a connection or check one out of the pool."""
+        started = time.perf_counter()
+        pool = self.pool
+        if pool is None:
+            connection = super().get_new_connection(conn_params)
+        else:
+            connection = pool.acquire(
+                lambda: super(DatabaseWrapper, self).get_new_connection(
+                    conn_params,
+                ),
+                check=self._is_alive if self.health_check_enabled else None,
+            )
+            self.isolation_level = self.settings_dict['OPTIONS'].get(
+                'isolation_level', connection.isolation_level,
+            )
+        observe_acquire(self.alias, time.perf_counter() - started)
+        return connection
+
+    def connect(self):
+        """Connect, a new connection needs no health check."""
+        super().connect()
+        self.health_check_done = True
+
+    def _close(self):
+        """Close the connection or give it back to the pool."""
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.release(self.connection)
+
+    def _cursor(self, name=None):
+        """Check a reused connection before its first query."""
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
+
+    def close_if_health_check_failed(self):
+        """Close the connection if the server no longer answers."""
+        if (
+            self.connection is None or
+            not self.health_check_enabled or
+            self.health_check_done
+        ):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        """Check the connection again in the next request."""
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def _is_alive(self, connection):
+        """Return whether a raw connection answers a query."""
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+        return True
@@ -0,0 +1,67 @@
+"""
+Database routing of reads to replicas.
+"""
+import contextlib
+import contextvars
+import random
+
+from django.conf import settings
+
+# The replica every read of the current request goes to, or None.
+_replica = contextvars.ContextVar('replica', default=None)
+
+
+def set_replica_reads(enabled):
+    """Pick a replica for the reads in the current context, or none."""
+    _replica.set(
+        random.choice(settings.DATABASE_REPLICAS)
+        if enabled and settings.DATABASE_REPLICAS else None
+    )
+
+
+def replica_reads_enabled():
+    """Return whether reads in the current context go to a replica."""
+    return _replica.get() in settings.DATABASE_REPLICAS
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """Read from the primary inside the block."""
+    token = _replica.set(None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Send reads to the replica picked for the request where allowed,
+    everything else to the primary.
+
+    Reads are only allowed from the replicas while handling a request
+    the ReplicaRoutingMiddleware lets through, so management commands,
+    signals run by writes and transactions stay on the primary. All reads
+    of a request use one replica, so they agree on how far it lags.
+    """
+
+    def db_for_read(self, model, **hints):
+        """Return the request's replica if reads from it are allowed."""
+        if model._meta.app_label == 'django_cache':
+            # Database caches are written on the primary, e.g. the pins.
+            return 'default'
+        if replica_reads_enabled():
+            return _replica.get()
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        """Write to the primary."""
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Relate objects from any database, all hold the same data."""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Migrate the primary only, replicas copy its schema."""
+        return db not in settings.DATABASE_REPLICAS
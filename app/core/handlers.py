@@ -0,0 +1,51 @@
+"""
+Request handlers for app.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers import asgi
+
+
+def next_part(parts):
+    """Return the next part of a streaming body, or None at the end."""
+    return next(parts, None)
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """
+    ASGI handler that reads streaming bodies outside the event loop.
+
+    Django 4.0 iterates streaming responses in the event loop, where the
+    ORM refuses to run, so the recipe export failed after its headers.
+    Parts are read on the thread that ran the view instead, which keeps
+    the connection of its server-side cursor.
+    """
+
+    async def send_response(self, response, send):
+        """Send the response, reading streaming parts in a thread."""
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        headers = [
+            (header.encode('ascii'), value.encode('latin1'))
+            for header, value in response.items()
+        ]
+        headers.extend(
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            for cookie in response.cookies.values()
+        )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': headers,
+        })
+        parts = iter(response)
+        read = sync_to_async(next_part, thread_sensitive=True)
+        while (part := await read(parts)) is not None:
+            for chunk, _ in self.chunk_bytes(part):
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
@@ -0,0 +1,104 @@
+"""
+Django command to benchmark the assigned_only tag filter
+"""
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import (
+    Recipe,
+    Tag,
+)
+from recipe.views import assigned_filter
+
+
+class Command(BaseCommand):
+    """Compare join + DISTINCT with EXISTS as recipe counts grow."""
+    help = (
+        'Time the first page of assigned tags for a throwaway user whose '
+        'tags are all used by a growing number of recipes, with the former '
+        'join + DISTINCT query and with the EXISTS semi-join. All data is '
+        'rolled back at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='1000,10000,50000',
+            help='Comma separated recipe counts to measure.',
+        )
+        parser.add_argument(
+            '--tags', type=int, default=50,
+            help='Number of tags, each linked to every recipe.',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Runs per query, the best one is reported.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        self.stdout.write(f'{"recipes":>10} {"join":>12} {"exists":>12}')
+
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(
+                'benchmark-assigned-only@example.com',
+            )
+            tags = Tag.objects.bulk_create(
+                Tag(user=user, name=f'Tag {i}')
+                for i in range(options['tags'])
+            )
+            created = 0
+            for size in sizes:
+                self._add_recipes(user, tags, size - created)
+                created = size
+                join = self._best_time(
+                    Tag.objects.filter(recipe__isnull=False).distinct(),
+                    user, options['repeat'],
+                )
+                exists = self._best_time(
+                    Tag.objects.filter(assigned_filter(Tag)),
+                    user, options['repeat'],
+                )
+                self.stdout.write(
+                    f'{size:>10} {join:>10.2f}ms {exists:>10.2f}ms'
+                )
+            transaction.set_rollback(True)
+
+    def _add_recipes(self, user, tags, count):
+        """Create recipes linked to every tag."""
+        recipes = Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    user=user, title='Benchmark', time_minutes=1,
+                    price=Decimal('1.00'),
+                )
+                for _ in range(count)
+            ),
+            batch_size=5000,
+        )
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+                for recipe in recipes
+                for tag in tags
+            ),
+            batch_size=5000,
+        )
+
+    def _best_time(self, queryset, user, repeat):
+        """Return the fastest time in ms to fetch the first page."""
+        page = queryset.filter(user=user).order_by('-name', '-id')[
+            :settings.API_PAGE_SIZE + 1
+        ]
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(page.all())
+            timings.append((time.perf_counter() - started) * 1000)
+
+        return min(timings)
@@ -0,0 +1,121 @@
+"""
+Django command to benchmark the recipe list serializers
+"""
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from rest_framework.renderers import JSONRenderer
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe.serializers import (
+    RecipeSerializer,
+    RecipeRowSerializer,
+)
+
+
+class Command(BaseCommand):
+    """Compare the model and row serializers of the recipe list."""
+    help = (
+        'Time rendering a page of recipes for a throwaway user with the '
+        'model serializer and prefetched relations, and with the row '
+        'serializer used by the list endpoint. Both outputs must be '
+        'identical. All data is rolled back at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=1000,
+            help='Number of recipes rendered.',
+        )
+        parser.add_argument(
+            '--attrs', type=int, default=3,
+            help='Number of tags and of ingredients on each recipe.',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Runs per serializer, the best one is reported.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(
+                'benchmark-recipe-list@example.com',
+            )
+            self._add_recipes(user, options['rows'], options['attrs'])
+            recipes = Recipe.objects.filter(user=user).order_by('-id')
+
+            model, model_body = self._best_time(
+                lambda: RecipeSerializer(
+                    recipes.prefetch_related('tags', 'ingredients'),
+                    many=True,
+                ),
+                options['repeat'],
+            )
+            rows, rows_body = self._best_time(
+                lambda: RecipeRowSerializer(
+                    recipes.values(*RecipeRowSerializer.row_fields()),
+                    many=True,
+                ),
+                options['repeat'],
+            )
+            transaction.set_rollback(True)
+
+        if model_body != rows_body:
+            raise CommandError('The serializers rendered different output.')
+        self.stdout.write(f'model: {model:.2f}ms')
+        self.stdout.write(f'rows: {rows:.2f}ms')
+        self.stdout.write(self.style.SUCCESS(
+            f'Identical output, {model / rows:.1f}x faster.'
+        ))
+
+    def _add_recipes(self, user, count, attrs):
+        """Create recipes linked to the same tags and ingredients."""
+        tags = Tag.objects.bulk_create(
+            Tag(user=user, name=f'Tag {i}') for i in range(attrs)
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(user=user, name=f'Ingredient {i}')
+            for i in range(attrs)
+        )
+        recipes = Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    user=user, title=f'Benchmark {i}', time_minutes=i,
+                    price=Decimal('1.50'), link='https://example.com',
+                )
+                for i in range(count)
+            ),
+            batch_size=5000,
+        )
+        links = [
+            (Recipe.tags.through, 'tag_id', tags),
+            (Recipe.ingredients.through, 'ingredient_id', ingredients),
+        ]
+        for through, column, objs in links:
+            through.objects.bulk_create(
+                (
+                    through(recipe_id=recipe.id, **{column: obj.id})
+                    for recipe in recipes
+                    for obj in objs
+                ),
+                batch_size=5000,
+            )
+
+    def _best_time(self, build, repeat):
+        """Return the fastest time in ms and the rendered JSON."""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            body = JSONRenderer().render(build().data)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        return min(timings), body
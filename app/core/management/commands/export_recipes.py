@@ -0,0 +1,45 @@
+"""
+Django command to export recipes as newline-delimited JSON
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Recipe
+from recipe.export import EXPORT_CHUNK_SIZE, iter_ndjson
+
+
+class Command(BaseCommand):
+    """Stream a user's recipes to a file or stdout."""
+    help = (
+        'Export the recipes of a user as newline-delimited JSON, reading '
+        'them through a server-side cursor in chunks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', required=True, help='Email of the recipes owner.',
+        )
+        parser.add_argument(
+            '--output', help='File to write to, stdout if omitted.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+            help='Number of recipes read and serialized at a time.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User {options["user"]} does not exist.')
+
+        queryset = Recipe.objects.filter(user=user).order_by('-id')
+        chunks = iter_ndjson(queryset, chunk_size=options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,310 @@
+"""
+Django command to bulk import recipes with PostgreSQL COPY
+"""
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe.conditional import bump_collection_version
+
+
+RECIPE_FIELDS = ['title', 'time_minutes', 'description', 'price', 'link']
+LINK_KINDS = [
+    ('tags', Tag),
+    ('ingredients', Ingredient),
+]
+
+
+def read_jsonl(stream):
+    """Yield a recipe dict, or its decoding error, for every line."""
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                # Reported with the record's position like invalid fields.
+                yield e
+
+
+def read_csv(stream):
+    """Yield a recipe dict for every row, splitting names on '|'."""
+    for row in csv.DictReader(stream):
+        for kind, _ in LINK_KINDS:
+            row[kind] = [
+                name for name in (row.get(kind) or '').split('|') if name
+            ]
+        yield row
+
+
+READERS = {
+    'jsonl': read_jsonl,
+    'csv': read_csv,
+}
+
+
+class Command(BaseCommand):
+    """Stream recipes from JSON lines or CSV into the database."""
+    help = (
+        'Import recipes for a user from a JSON lines or CSV file, or from '
+        'stdin with "-". Rows are loaded with COPY into staging tables and '
+        'merged in batches, one transaction per batch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to read, or "-" for stdin.')
+        parser.add_argument(
+            '--user', required=True, help='Email of the recipes owner.',
+        )
+        parser.add_argument(
+            '--format', choices=sorted(READERS),
+            help='Input format, guessed from the file extension if omitted.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Number of records merged per transaction.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='File recording the committed records, to resume from.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User {options["user"]} does not exist.')
+
+        path = options['path']
+        input_format = options['format']
+        if input_format is None:
+            extension = os.path.splitext(path)[1].lstrip('.').lower()
+            input_format = 'csv' if extension == 'csv' else 'jsonl'
+
+        checkpoint = options['checkpoint']
+        skip = self._read_checkpoint(checkpoint)
+        if skip:
+            self.stdout.write(f'Resuming after {skip} records...')
+
+        if path == '-':
+            self._import(
+                user, READERS[input_format](sys.stdin), options, skip,
+            )
+            return
+        try:
+            stream = open(path, encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError(f'Cannot open {path}: {e}')
+        with stream:
+            self._import(user, READERS[input_format](stream), options, skip)
+
+    def _import(self, user, records, options, skip):
+        """Merge the records in batches and report the throughput."""
+        batch_size = options['batch_size']
+        checkpoint = options['checkpoint']
+        consumed = skip
+        imported = 0
+        failed = 0
+        started = time.monotonic()
+
+        self._create_staging_tables()
+        try:
+            batch = []
+            position = skip
+            for position, record in self._enumerate(records):
+                if position <= skip:
+                    continue
+                try:
+                    batch.append(self._clean_record(record))
+                except (KeyError, TypeError, ValueError, ValidationError) as e:
+                    failed += 1
+                    self.stderr.write(f'Skipping record {position}: {e}')
+                if position - consumed >= batch_size:
+                    imported += self._merge_batch(user, batch)
+                    consumed = position
+                    batch = []
+                    self._write_checkpoint(checkpoint, consumed)
+                    self._report(imported, started)
+
+            if position > consumed:
+                imported += self._merge_batch(user, batch)
+                self._write_checkpoint(checkpoint, position)
+        finally:
+            self._drop_staging_tables()
+
+        elapsed = time.monotonic() - started
+        rate = imported / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} recipes, skipped {failed} invalid records '
+            f'in {elapsed:.2f}s ({rate:.0f} rows/s).'
+        ))
+
+    def _enumerate(self, records):
+        """Number the records, failing on input that cannot be read."""
+        position = 0
+        try:
+            for position, record in enumerate(records, start=1):
+                yield position, record
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise CommandError(f'Cannot read record {position + 1}: {e}')
+
+    def _clean_record(self, record):
+        """Validate a record against the model fields."""
+        if isinstance(record, ValueError):
+            raise record
+        if not isinstance(record, dict):
+            raise ValueError('Expected a JSON object.')
+        row = [
+            Recipe._meta.get_field(name).clean(record.get(name, ''), None)
+            for name in RECIPE_FIELDS
+        ]
+        links = {}
+        for kind, model in LINK_KINDS:
+            name_field = model._meta.get_field('name')
+            links[kind] = [
+                name_field.clean(
+                    item['name'] if isinstance(item, dict) else item, None,
+                )
+                for item in record.get(kind) or []
+            ]
+
+        return row, links
+
+    def _create_staging_tables(self):
+        """Create the session-local tables COPY loads into."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS import_recipe ('
+                'seq integer PRIMARY KEY, title text, time_minutes integer, '
+                'description text, price numeric, link text, '
+                'recipe_id bigint)'
+            )
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS import_link ('
+                'seq integer, kind text, name text)'
+            )
+
+    def _drop_staging_tables(self):
+        """Drop the staging tables."""
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS import_recipe, import_link')
+
+    def _copy(self, cursor, table, columns, rows):
+        """Load rows into a staging table with COPY."""
+        buffer = io.StringIO()
+        csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(rows)
+        buffer.seek(0)
+        cursor.copy_expert(
+            f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH CSV',
+            buffer,
+        )
+
+    def _merge_batch(self, user, batch):
+        """Copy a batch into the staging tables and merge it set-wise."""
+        if not batch:
+            return 0
+
+        recipe_table = Recipe._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('TRUNCATE import_recipe, import_link')
+            self._copy(
+                cursor, 'import_recipe', ['seq'] + RECIPE_FIELDS,
+                ([seq] + row for seq, (row, _) in enumerate(batch)),
+            )
+            self._copy(
+                cursor, 'import_link', ['seq', 'kind', 'name'],
+                (
+                    [seq, kind, name]
+                    for seq, (_, links) in enumerate(batch)
+                    for kind, names in links.items()
+                    for name in names
+                ),
+            )
+            # Reserve ids up front so links can be joined on seq.
+            cursor.execute(
+                'UPDATE import_recipe SET recipe_id = '
+                f"nextval(pg_get_serial_sequence('{recipe_table}', 'id'))"
+            )
+            cursor.execute(
+                f'INSERT INTO {recipe_table} '
+                '(id, user_id, title, time_minutes, description, price, link, '
+                'image_variants, tag_ids, ingredient_ids) '
+                'SELECT recipe_id, %s, title, time_minutes, description, '
+                "price, link, '{}', '{}', '{}' FROM import_recipe",
+                [user.pk],
+            )
+            for kind, model in LINK_KINDS:
+                self._merge_links(cursor, user, kind, model)
+            Recipe.objects.filter(
+                pk__in=RawSQL('SELECT recipe_id FROM import_recipe', []),
+            ).sync_attr_ids()
+
+        bump_collection_version(user)
+        return len(batch)
+
+    def _merge_links(self, cursor, user, kind, model):
+        """Create missing names of one kind and link them to recipes."""
+        table = model._meta.db_table
+        through = Recipe._meta.get_field(kind).remote_field.through
+        column = f'{model._meta.model_name}_id'
+        cursor.execute(
+            f'INSERT INTO {table} (user_id, name, recipe_count) '
+            'SELECT DISTINCT %s, name, 0 FROM import_link WHERE kind = %s '
+            'ON CONFLICT (user_id, name) DO NOTHING',
+            [user.pk, kind],
+        )
+        cursor.execute(
+            f'INSERT INTO {through._meta.db_table} (recipe_id, {column}) '
+            'SELECT DISTINCT r.recipe_id, t.id FROM import_link l '
+            'JOIN import_recipe r ON r.seq = l.seq '
+            f'JOIN {table} t ON t.user_id = %s AND t.name = l.name '
+            'WHERE l.kind = %s ON CONFLICT DO NOTHING',
+            [user.pk, kind],
+        )
+        cursor.execute(
+            f'UPDATE {table} t SET recipe_count = t.recipe_count + c.n '
+            f'FROM (SELECT {column}, count(*) AS n '
+            f'FROM {through._meta.db_table} '
+            'WHERE recipe_id IN (SELECT recipe_id FROM import_recipe) '
+            f'GROUP BY {column}) c WHERE t.id = c.{column}',
+        )
+
+    def _read_checkpoint(self, checkpoint):
+        """Return the number of records committed by a previous run."""
+        if not checkpoint or not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint) as f:
+            value = f.read().strip()
+        try:
+            return int(value or 0)
+        except ValueError:
+            raise CommandError(f'Invalid checkpoint {checkpoint}: {value!r}')
+
+    def _write_checkpoint(self, checkpoint, consumed):
+        """Atomically record the number of committed records."""
+        if not checkpoint:
+            return
+        tmp_path = f'{checkpoint}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(consumed))
+        os.replace(tmp_path, checkpoint)
+
+    def _report(self, imported, started):
+        """Write the progress and current throughput."""
+        elapsed = time.monotonic() - started
+        rate = imported / elapsed if elapsed else 0
+        self.stdout.write(f'Imported {imported} recipes ({rate:.0f} rows/s)')
@@ -0,0 +1,163 @@
+"""
+Django command to load test API servers with concurrent connections
+"""
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_framework.authtoken.models import Token
+
+
+class Command(BaseCommand):
+    """Compare the throughput of deployments under concurrent clients."""
+    help = (
+        'Send authenticated GET requests to each target over keep-alive '
+        'connections for a fixed duration per concurrency level, and '
+        'report requests per second and latency percentiles. Targets are '
+        'given as name=url, e.g. wsgi=http://localhost:8001 '
+        'asgi=http://localhost:8002.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'targets', nargs='+',
+            help='Servers to compare, as name=url.',
+        )
+        parser.add_argument(
+            '--path', default='/api/recipe/recipes/',
+            help='Path requested on every target.',
+        )
+        parser.add_argument(
+            '--concurrency', default='1,10,50,100',
+            help='Comma separated numbers of concurrent connections.',
+        )
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Seconds spent on each target and concurrency.',
+        )
+        parser.add_argument(
+            '--email',
+            help='User whose API token authenticates the requests.',
+        )
+        parser.add_argument(
+            '--token',
+            help='API token to use instead of the one of --email.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        targets = []
+        for target in options['targets']:
+            name, sep, url = target.partition('=')
+            if not sep or not urlsplit(url).hostname:
+                raise CommandError(f'Invalid target {target!r}.')
+            targets.append((name, urlsplit(url)))
+        token = options['token'] or self._get_token(options['email'])
+        levels = [int(level) for level in options['concurrency'].split(',')]
+
+        self.stdout.write(
+            f'{"target":>10} {"clients":>8} {"requests":>9} {"req/s":>9} '
+            f'{"p50":>10} {"p99":>10} {"errors":>7}'
+        )
+        for name, url in targets:
+            for level in levels:
+                latencies, errors = asyncio.run(self._run(
+                    url, options['path'], token, level, options['duration'],
+                ))
+                self._report(name, level, options['duration'], latencies,
+                             errors)
+
+    def _get_token(self, email):
+        """Return the API token of the user with the email."""
+        if not email:
+            raise CommandError('Pass --email or --token.')
+        try:
+            user = get_user_model().objects.get(email=email)
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with email {email}.')
+        return Token.objects.get_or_create(user=user)[0].key
+
+    async def _run(self, url, path, token, concurrency, duration):
+        """Return the latencies in ms of successful requests and errors."""
+        request = (
+            f'GET {path} HTTP/1.1\r\n'
+            f'Host: {url.netloc}\r\n'
+            f'Authorization: Token {token}\r\n'
+            'Accept: application/json\r\n'
+            '\r\n'
+        ).encode()
+        deadline = time.perf_counter() + duration
+        results = await asyncio.gather(*[
+            self._client(url, request, deadline) for _ in range(concurrency)
+        ])
+        latencies = [ms for client, _ in results for ms in client]
+        return latencies, sum(errors for _, errors in results)
+
+    async def _client(self, url, request, deadline):
+        """Send requests on one connection until the deadline."""
+        latencies = []
+        errors = 0
+        writer = None
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            reused = writer is not None
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(
+                        url.hostname, url.port or 80,
+                    )
+                writer.write(request)
+                status, keep_alive = await self._read_response(reader)
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                if writer is not None:
+                    writer.close()
+                    writer = None
+                if reused:
+                    # The server closed the idle connection, reconnect.
+                    continue
+                status, keep_alive = None, False
+            if status == 200:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors += 1
+            if not keep_alive and writer is not None:
+                writer.close()
+                writer = None
+        if writer is not None:
+            writer.close()
+        return latencies, errors
+
+    async def _read_response(self, reader):
+        """Read a response, returning its status and if it is kept alive."""
+        head = await reader.readuntil(b'\r\n\r\n')
+        status_line, *header_lines = head.decode('latin1').split('\r\n')
+        headers = {}
+        for line in header_lines:
+            name, sep, value = line.partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+            keep_alive = headers.get('connection', '').lower() != 'close'
+        else:
+            await reader.read()
+            keep_alive = False
+        return int(status_line.split()[1]), keep_alive
+
+    def _report(self, name, concurrency, duration, latencies, errors):
+        """Write the results of one run."""
+        if len(latencies) > 1:
+            p50 = statistics.median(latencies)
+            p99 = statistics.quantiles(latencies, n=100)[98]
+        else:
+            p50 = p99 = latencies[0] if latencies else 0
+        self.stdout.write(
+            f'{name:>10} {concurrency:>8} {len(latencies):>9} '
+            f'{len(latencies) / duration:>9.1f} {p50:>8.2f}ms '
+            f'{p99:>8.2f}ms {errors:>7}'
+        )
@@ -0,0 +1,28 @@
+"""
+Django command to recompute the recipe counts of tags and ingredients
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import (
+    Tag,
+    Ingredient,
+)
+
+
+class Command(BaseCommand):
+    """Recompute Tag.recipe_count and Ingredient.recipe_count."""
+    help = (
+        'Recompute the recipe counts of tags and ingredients from the '
+        'recipe links and fix the ones that drifted.'
+    )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        for model in (Tag, Ingredient):
+            with transaction.atomic():
+                repaired = model.objects.repair_recipe_counts()
+            self.stdout.write(self.style.SUCCESS(
+                f'Repaired {repaired} {model._meta.verbose_name_plural} '
+                'recipe counts.'
+            ))
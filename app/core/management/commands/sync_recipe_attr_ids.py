@@ -0,0 +1,63 @@
+"""
+Django command to backfill and verify the recipe tag and ingredient id arrays
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+    """Copy the tag and ingredient links of recipes to their id arrays."""
+    help = (
+        'Recompute Recipe.tag_ids and Recipe.ingredient_ids from the link '
+        'tables in batches, or with --verify only report the recipes whose '
+        'arrays are out of sync.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Report stale arrays and fail instead of fixing them.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Number of recipes updated per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        verify = options['verify']
+        batch_size = options['batch_size']
+        last_id = 0
+        stale = 0
+        synced = 0
+
+        while True:
+            ids = list(
+                Recipe.objects.filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+
+            batch = Recipe.objects.filter(pk__gt=last_id, pk__lte=ids[-1])
+            if verify:
+                stale += batch.stale_attr_ids().count()
+            else:
+                with transaction.atomic():
+                    synced += batch.sync_attr_ids()
+            last_id = ids[-1]
+
+        if verify:
+            if stale:
+                raise CommandError(
+                    f'{stale} recipes have tag or ingredient ids out of sync.'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                'All recipe tag and ingredient ids are in sync.'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Synced the tag and ingredient ids of {synced} recipes.'
+            ))
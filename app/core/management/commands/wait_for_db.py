@@ -1,29 +1,98 @@
 """
 Django command to wait for db to be available
 """
-
+import math
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-from psycopg2 import OperationalError as Psycopg2OpError
-
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
 
 
 class Command(BaseCommand):
-    # Django command to wait for db
+    """Wait until every database accepts connections."""
+    help = (
+        'Probe the databases concurrently with a plain connect, retrying '
+        'with exponential backoff and jitter until all of them are ready '
+        'or the timeout expires.'
+    )
+    # Nothing is checked until the databases are up.
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='Alias to wait for, all configured aliases by default.',
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='Seconds to wait before failing.',
+        )
+        parser.add_argument(
+            '--initial-delay', type=float, default=0.1,
+            help='Seconds before the first retry, doubled on each retry.',
+        )
+        parser.add_argument(
+            '--max-delay', type=float, default=2,
+            help='Upper bound of the seconds between retries.',
+        )
 
     def handle(self, *args, **options):
         """Entrypoint for command"""
+        aliases = options['databases'] or list(connections)
+        started = time.monotonic()
+        deadline = started + options['timeout']
         self.stdout.write('Waiting for database...')
-        db_up = False
-        while db_up is False:
-            try:
-                self.check(databases=['default'])
-                db_up = True
-            except (Psycopg2OpError, OperationalError):
-                self.stdout.write('Databases unavailable, \
-                    waiting for 1 second...')
-                time.sleep(1)
 
+        with ThreadPoolExecutor(max_workers=len(aliases)) as executor:
+            results = executor.map(
+                lambda alias: self._wait(alias, started, deadline, options),
+                aliases,
+            )
+            results = dict(zip(aliases, results))
+
+        unavailable = [
+            alias for alias, result in results.items() if result is None
+        ]
+        if unavailable:
+            raise CommandError(
+                f'Databases unavailable after {options["timeout"]:g}s: '
+                f'{", ".join(unavailable)}'
+            )
+        for alias, (elapsed, attempts) in results.items():
+            self.stdout.write(
+                f'{alias} ready in {elapsed:.2f}s after {attempts} attempt(s)'
+            )
         self.stdout.write(self.style.SUCCESS('Database available!'))
+
+    def probe(self, alias, timeout):
+        """Open and close a connection to the alias."""
+        connection = connections[alias].copy()
+        connection.settings_dict['OPTIONS'] = {
+            **connection.settings_dict['OPTIONS'],
+            'connect_timeout': max(1, math.ceil(timeout)),
+        }
+        try:
+            connection.ensure_connection()
+        finally:
+            connection.close()
+
+    def _wait(self, alias, started, deadline, options):
+        """Return the seconds and attempts until ready, None on timeout."""
+        delay = options['initial_delay']
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                self.probe(alias, deadline - time.monotonic())
+                return time.monotonic() - started, attempts
+            except OperationalError as error:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stderr.write(f'{alias}: {error}'.strip())
+                    return None
+            # Half fixed, half random so replicas do not retry in lockstep.
+            time.sleep(min(random.uniform(delay / 2, delay), remaining))
+            delay = min(delay * 2, options['max_delay'])
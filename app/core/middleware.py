@@ -0,0 +1,89 @@
+"""
+Middleware for the APIs.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_framework.permissions import SAFE_METHODS
+
+from core.db.routers import set_replica_reads
+
+REPLICA_PIN_COOKIE = 'replica_pin'
+
+
+def replica_pin_key(request):
+    """Return the cache key pinning the client to the primary, or None."""
+    credentials = (
+        request.headers.get('Authorization') or
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    digest = hashlib.sha256(credentials.encode()).hexdigest()
+    return f'replica-pin:{digest}'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Read from the replicas in safe requests to views that allow it.
+
+    Views opt in with read_from_replica. A client that sent a write reads
+    from the primary for REPLICA_PIN_SECONDS after it, so it sees its own
+    changes while they reach the replicas. Clients are told apart by their
+    Authorization header or session cookie and pinned in the
+    REPLICA_PIN_CACHE, which all workers share. A signed cookie also
+    pins clients that send neither.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        set_replica_reads(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            set_replica_reads(False)
+
+        if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS:
+            key = replica_pin_key(request)
+            if key is not None:
+                caches[settings.REPLICA_PIN_CACHE].set(
+                    key, True, settings.REPLICA_PIN_SECONDS,
+                )
+            response.set_signed_cookie(
+                REPLICA_PIN_COOKIE, '1',
+                salt=REPLICA_PIN_COOKIE,
+                max_age=settings.REPLICA_PIN_SECONDS,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Allow replica reads for the view unless the client is pinned."""
+        view_class = getattr(view_func, 'cls', None)
+        if (
+            settings.DATABASE_REPLICAS and
+            request.method in SAFE_METHODS and
+            getattr(view_class, 'read_from_replica', False)
+        ):
+            set_replica_reads(not self.is_pinned(request))
+
+    def is_pinned(self, request):
+        """Return whether the client wrote within REPLICA_PIN_SECONDS."""
+        cookie = request.get_signed_cookie(
+            REPLICA_PIN_COOKIE, default=None,
+            salt=REPLICA_PIN_COOKIE,
+            max_age=settings.REPLICA_PIN_SECONDS,
+        )
+        if cookie is not None:
+            return True
+        key = replica_pin_key(request)
+        return (
+            key is not None and
+            caches[settings.REPLICA_PIN_CACHE].get(key, False)
+        )
@@ -0,0 +1,44 @@
+# Generated by Django 4.0.10 on 2026-10-17 06:01
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """Merge tags and ingredients sharing a user and name into one row."""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, field_name in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = Recipe._meta.get_field(field_name).remote_field.through
+        column = f'{model_name.lower()}_id'
+        duplicates = model.objects.values('user', 'name').annotate(
+            keep_id=Min('id'),
+            total=Count('id'),
+        ).filter(total__gt=1)
+        for duplicate in duplicates.iterator():
+            others = model.objects.filter(
+                user=duplicate['user'],
+                name=duplicate['name'],
+            ).exclude(id=duplicate['keep_id'])
+            recipe_ids = through.objects.filter(
+                **{f'{column}__in': others},
+            ).values_list('recipe_id', flat=True).distinct()
+            through.objects.bulk_create(
+                [
+                    through(recipe_id=recipe_id, **{column: duplicate['keep_id']})
+                    for recipe_id in recipe_ids
+                ],
+                ignore_conflicts=True,
+            )
+            others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
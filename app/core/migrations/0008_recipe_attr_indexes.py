@@ -0,0 +1,44 @@
+# Generated by Django 4.0.10 on 2026-10-17 06:01
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+def add_unique_constraint_concurrently(model_name, table, name):
+    """Build a unique index without blocking writes, then attach it."""
+    return migrations.SeparateDatabaseAndState(
+        database_operations=[
+            migrations.RunSQL(
+                sql=f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} (user_id, name)',
+                reverse_sql=f'DROP INDEX CONCURRENTLY IF EXISTS {name}',
+            ),
+            migrations.RunSQL(
+                sql=f'ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}',
+                reverse_sql=f'ALTER TABLE {table} DROP CONSTRAINT {name}',
+            ),
+        ],
+        state_operations=[
+            migrations.AddConstraint(
+                model_name=model_name,
+                constraint=models.UniqueConstraint(fields=('user', 'name'), name=name),
+            ),
+        ],
+    )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('core', '0007_merge_duplicate_recipe_attrs'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-id'], name='recipe_user_id_idx'),
+        ),
+        add_unique_constraint_concurrently('ingredient', 'core_ingredient', 'unique_ingredient_user_name'),
+        add_unique_constraint_concurrently('tag', 'core_tag', 'unique_tag_user_name'),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.10 on 2026-10-17 06:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recipe_attr_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='collection_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
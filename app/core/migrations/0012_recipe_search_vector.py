@@ -0,0 +1,68 @@
+# Generated by Django 4.0.10 on 2026-10-17 06:17
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('pg_catalog.english', coalesce({row}title, '')), 'A') || "
+    "setweight(to_tsvector('pg_catalog.english', coalesce({row}description, '')), 'B')"
+)
+
+CREATE_TRIGGER_SQL = f"""
+CREATE FUNCTION core_recipe_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR_SQL.format(row='NEW.')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_search_vector_update
+    BEFORE INSERT OR UPDATE OF title, description, search_vector
+    ON core_recipe FOR EACH ROW
+    EXECUTE FUNCTION core_recipe_search_vector_update();
+"""
+
+DROP_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS core_recipe_search_vector_update ON core_recipe;
+DROP FUNCTION IF EXISTS core_recipe_search_vector_update();
+"""
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def backfill_search_vector(apps, schema_editor):
+    """Fill the vector of existing recipes in short transactions."""
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            cursor.execute(
+                f'UPDATE core_recipe SET search_vector = {SEARCH_VECTOR_SQL.format(row="")} '
+                'WHERE id IN (SELECT id FROM core_recipe '
+                'WHERE search_vector IS NULL LIMIT %s)',
+                [BACKFILL_BATCH_SIZE],
+            )
+            if cursor.rowcount < BACKFILL_BATCH_SIZE:
+                break
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0011_imageblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(sql=CREATE_TRIGGER_SQL, reverse_sql=DROP_TRIGGER_SQL),
+        migrations.RunPython(backfill_search_vector, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_vector_idx'),
+        ),
+    ]
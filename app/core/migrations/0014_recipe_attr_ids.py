@@ -0,0 +1,63 @@
+# Generated by Django 4.0.10 on 2026-10-17 06:23
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def backfill_attr_ids(apps, schema_editor):
+    """Copy the tag and ingredient links of existing recipes in batches."""
+    with schema_editor.connection.cursor() as cursor:
+        last_id = 0
+        while True:
+            cursor.execute(
+                'SELECT max(id) FROM (SELECT id FROM core_recipe WHERE id > %s '
+                'ORDER BY id LIMIT %s) batch',
+                [last_id, BACKFILL_BATCH_SIZE],
+            )
+            batch_end = cursor.fetchone()[0]
+            if batch_end is None:
+                break
+            cursor.execute(
+                'UPDATE core_recipe r SET '
+                'tag_ids = ARRAY(SELECT tag_id FROM core_recipe_tags '
+                'WHERE recipe_id = r.id ORDER BY tag_id), '
+                'ingredient_ids = ARRAY(SELECT ingredient_id FROM core_recipe_ingredients '
+                'WHERE recipe_id = r.id ORDER BY ingredient_id) '
+                'WHERE r.id > %s AND r.id <= %s',
+                [last_id, batch_end],
+            )
+            last_id = batch_end
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0013_recipe_attr_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tag_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.RunPython(backfill_attr_ids, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['user', 'tag_ids'], name='recipe_user_tag_ids_idx', opclasses=['int8_ops', 'array_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['user', 'ingredient_ids'], name='recipe_user_ingredient_ids_idx', opclasses=['int8_ops', 'array_ops']),
+        ),
+    ]
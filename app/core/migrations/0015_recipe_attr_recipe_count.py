@@ -0,0 +1,47 @@
+# Generated by Django 4.0.10 on 2026-10-17 06:29
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+def count_recipes(table, through, column):
+    """Set the recipe count of every row from the link table."""
+    return migrations.RunSQL(
+        sql=(
+            f'UPDATE {table} t SET recipe_count = c.n FROM ('
+            f'SELECT {column}, count(*) AS n FROM {through} GROUP BY {column}'
+            f') c WHERE c.{column} = t.id'
+        ),
+        reverse_sql=migrations.RunSQL.noop,
+    )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0014_recipe_attr_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        count_recipes('core_ingredient', 'core_recipe_ingredients', 'ingredient_id'),
+        count_recipes('core_tag', 'core_recipe_tags', 'tag_id'),
+        AddIndexConcurrently(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-recipe_count', '-id'], name='ingredient_recipe_count_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='tag',
+            index=models.Index(fields=['user', '-recipe_count', '-id'], name='tag_recipe_count_idx'),
+        ),
+    ]
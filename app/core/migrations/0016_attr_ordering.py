@@ -0,0 +1,21 @@
+# Generated by Django 4.0.10 on 2026-10-17 06:38
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_recipe_attr_recipe_count'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='ingredient',
+            options={'ordering': ['id']},
+        ),
+        migrations.AlterModelOptions(
+            name='tag',
+            options={'ordering': ['id']},
+        ),
+    ]
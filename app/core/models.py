@@ -1,24 +1,45 @@
 """
 Database models.
 """
-import uuid
 import os
+from functools import partial
 
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.expressions import ArraySubquery
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
 
+from core.uploadhandlers import file_sha256
+
+
+RECIPE_ATTR_ID_FIELDS = {
+    'tags': 'tag_ids',
+    'ingredients': 'ingredient_ids',
+}
+
+
+def image_file_path(digest, filename):
+    """Return the content-addressed path of an image."""
+    extension = os.path.splitext(filename)[1].lower()
+
+    return os.path.join(
+        'uploads', 'recipe', digest[:2], f'{digest}{extension}',
+    )
+
 
 def recipe_image_file_path(instance, filename):
     """Generate file path for new recipe image."""
-    extension = os.path.splitext(filename)[1]
-    filename = f'{uuid.uuid4()}{extension}'
-
-    return os.path.join('uploads', 'recipe', filename)
+    return image_file_path(file_sha256(instance.image.file), filename)
 
 
 class UserManager(BaseUserManager):
@@ -45,19 +66,130 @@ class UserManager(BaseUserManager):
         return user
 
 
-class User(AbstractBaseUser, PermissionsMixin):
+class RecipeAttrManager(models.Manager):
+    """Manager for recipe attributes identified by name."""
+
+    def get_or_create_by_names(self, user, names):
+        """Return objects for the names, bulk creating the missing ones."""
+        names = list(dict.fromkeys(names))
+        objs = {
+            obj.name: obj
+            for obj in self.filter(user=user, name__in=names)
+        }
+        missing = [
+            self.model(user=user, name=name)
+            for name in names if name not in objs
+        ]
+        if missing:
+            # Names created concurrently are skipped and then read back.
+            self.bulk_create(missing, ignore_conflicts=True)
+            created = self.filter(
+                user=user,
+                name__in=[obj.name for obj in missing],
+            )
+            objs.update((obj.name, obj) for obj in created)
+
+        return [objs[name] for name in names]
+
+    def add_recipe_counts(self, counts):
+        """Add the given number of recipes to each object, by id."""
+        by_delta = {}
+        for pk, delta in counts.items():
+            by_delta.setdefault(delta, []).append(pk)
+        for delta, pks in by_delta.items():
+            self.filter(pk__in=pks).update(
+                recipe_count=F('recipe_count') + delta,
+            )
+
+    def repair_recipe_counts(self):
+        """Recompute wrong recipe counts from the links, return how many."""
+        field = next(
+            field for field in Recipe._meta.many_to_many
+            if field.related_model is self.model
+        )
+        column = f'{self.model._meta.model_name}_id'
+        actual = Coalesce(
+            Subquery(
+                field.remote_field.through.objects.filter(
+                    **{column: OuterRef('pk')}
+                ).values(column).annotate(count=Count('*')).values('count'),
+            ),
+            0,
+        )
+        wrong = self.annotate(actual=actual).exclude(
+            recipe_count=F('actual'),
+        )
+        return self.filter(pk__in=wrong.values('pk')).update(
+            recipe_count=actual,
+        )
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Queries for recipes."""
+
+    def _linked_ids(self, field_name):
+        """Return a subquery of the ids linked to a recipe, in order."""
+        field = self.model._meta.get_field(field_name)
+        column = f'{field.related_model._meta.model_name}_id'
+        return ArraySubquery(
+            field.remote_field.through.objects.filter(
+                recipe_id=OuterRef('pk'),
+            ).order_by(column).values(column),
+        )
+
+    def sync_attr_ids(self, fields=RECIPE_ATTR_ID_FIELDS):
+        """Recompute the denormalized id arrays from the link tables."""
+        return self.update(**{
+            RECIPE_ATTR_ID_FIELDS[field_name]: self._linked_ids(field_name)
+            for field_name in fields
+        })
+
+    def stale_attr_ids(self):
+        """Return the recipes whose id arrays differ from the links."""
+        stale = Q()
+        annotations = {}
+        for field_name, ids_field in RECIPE_ATTR_ID_FIELDS.items():
+            annotations[f'linked_{ids_field}'] = self._linked_ids(field_name)
+            stale |= ~Q(**{ids_field: F(f'linked_{ids_field}')})
+        return self.annotate(**annotations).filter(stale)
+
+
+class MaintainedFieldsMixin:
+    """Leave fields kept up to date by queries out of save() updates."""
+    maintained_fields = ()
+
+    def save(self, *args, **kwargs):
+        """Save the instance without writing back maintained fields."""
+        if (
+            not args and not self._state.adding and
+            kwargs.get('update_fields') is None and
+            not kwargs.get('force_insert')
+        ):
+            # A loaded copy may hold values that are already outdated.
+            skipped = {*self.maintained_fields, *self.get_deferred_fields()}
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(MaintainedFieldsMixin, AbstractBaseUser, PermissionsMixin):
     """User in the system."""
     email = models.EmailField(max_length=255, unique=True)
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Bumped with update queries, see recipe.conditional.
+    collection_version = models.PositiveBigIntegerField(default=0)
 
     objects = UserManager()
+    maintained_fields = ('collection_version',)
 
     USERNAME_FIELD = 'email'
 
 
-class Recipe(models.Model):
+class Recipe(MaintainedFieldsMixin, models.Model):
     """Recipe object."""
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -71,30 +203,178 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image_variants = models.JSONField(default=dict, blank=True)
+    # Maintained by a database trigger from the title and description.
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Copies of the tag and ingredient links, kept in sync by signals.
+    tag_ids = ArrayField(
+        models.BigIntegerField(), default=list, blank=True, editable=False,
+    )
+    ingredient_ids = ArrayField(
+        models.BigIntegerField(), default=list, blank=True, editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+    maintained_fields = tuple(RECIPE_ATTR_ID_FIELDS.values())
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-id'], name='recipe_user_id_idx'),
+            GinIndex(
+                fields=['search_vector'], name='recipe_search_vector_idx',
+            ),
+            GinIndex(
+                fields=['user', 'tag_ids'],
+                name='recipe_user_tag_ids_idx',
+                opclasses=['int8_ops', 'array_ops'],
+            ),
+            GinIndex(
+                fields=['user', 'ingredient_ids'],
+                name='recipe_user_ingredient_ids_idx',
+                opclasses=['int8_ops', 'array_ops'],
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
 
-class Tag(models.Model):
+class Tag(MaintainedFieldsMixin, models.Model):
     """Tag for filtering recipes."""
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    # Number of linked recipes, kept up to date by signals.
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = RecipeAttrManager()
+    maintained_fields = ('recipe_count',)
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_tag_user_name',
+            ),
+        ]
+        indexes = [
+            GinIndex(
+                fields=['user', 'name'],
+                name='tag_user_name_trgm_idx',
+                opclasses=['int8_ops', 'gin_trgm_ops'],
+            ),
+            models.Index(
+                fields=['user', '-recipe_count', '-id'],
+                name='tag_recipe_count_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Ingredient(models.Model):
+class Ingredient(MaintainedFieldsMixin, models.Model):
     """Ingredient for recipes."""
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    # Number of linked recipes, kept up to date by signals.
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = RecipeAttrManager()
+    maintained_fields = ('recipe_count',)
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_ingredient_user_name',
+            ),
+        ]
+        indexes = [
+            GinIndex(
+                fields=['user', 'name'],
+                name='ingredient_user_name_trgm_idx',
+                opclasses=['int8_ops', 'gin_trgm_ops'],
+            ),
+            models.Index(
+                fields=['user', '-recipe_count', '-id'],
+                name='ingredient_recipe_count_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
+
+
+def delete_files(names):
+    """Delete files from the default storage."""
+    for name in names:
+        default_storage.delete(name)
+
+
+class ImageBlobManager(models.Manager):
+    """Manager for reference counted image files."""
+
+    def acquire(self, file):
+        """Store a file unless its content exists, and reference it."""
+        digest = file_sha256(file)
+        with transaction.atomic():
+            # Concurrent uploads of new content wait here for the first.
+            blob, created = self.get_or_create(
+                sha256=digest,
+                defaults={'path': image_file_path(digest, file.name)},
+            )
+            blob = self.select_for_update().get(pk=blob.pk)
+            # The file of a just released blob may still await deletion.
+            if not default_storage.exists(blob.path) or created:
+                name = default_storage.save(blob.path, file)
+                if name != blob.path:
+                    # The storage picked another name, point at that file.
+                    blob.path = name
+                    blob.save(update_fields=['path'])
+            self.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+        return blob
+
+    def release(self, name):
+        """Drop a reference, deleting the files when none are left."""
+        with transaction.atomic():
+            blob = self.select_for_update().filter(path=name).first()
+            if blob is None:
+                return
+
+            blob.ref_count -= 1
+            if blob.ref_count > 0:
+                blob.save(update_fields=['ref_count'])
+                return
+
+            blob.delete()
+            transaction.on_commit(partial(delete_files, blob.files()))
+
+
+class ImageBlob(models.Model):
+    """Image file stored once under the hash of its content."""
+    sha256 = models.CharField(max_length=64, unique=True)
+    path = models.CharField(max_length=255, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    variants = models.JSONField(default=dict, blank=True)
+
+    objects = ImageBlobManager()
+
+    def __str__(self):
+        return self.path
+
+    def files(self):
+        """Return the names of the image and its variants."""
+        return [self.path] + [
+            name
+            for files in self.variants.values()
+            for name in files.values()
+        ]
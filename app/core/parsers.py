@@ -0,0 +1,58 @@
+"""
+Parsers for the APIs.
+"""
+import codecs
+import io
+import re
+
+import msgpack
+import orjson
+
+from django.conf import settings
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+from core.renderers import FastJSONRenderer, MessagePackRenderer
+
+# orjson reads integers wider than 64 bits as floats, json keeps them exact.
+LONG_NUMBER_RE = re.compile(rb'\d{19}')
+
+
+class FastJSONParser(JSONParser):
+    """
+    Parse JSON with orjson, with the results of JSONParser.
+
+    Bodies in other charsets than UTF-8, with numbers of 19 digits or more
+    or that orjson rejects are parsed by JSONParser.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """Parse the incoming bytestream as JSON."""
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        body = stream.read()
+
+        if (
+            codecs.lookup(encoding).name == 'utf-8' and
+            not LONG_NUMBER_RE.search(body)
+        ):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(io.BytesIO(body), media_type, parser_context)
+
+
+class MessagePackParser(BaseParser):
+    """Parse MessagePack request bodies."""
+    media_type = 'application/msgpack'
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """Parse the incoming bytestream as MessagePack."""
+        try:
+            return msgpack.unpackb(stream.read())
+        except ValueError as exc:
+            raise ParseError('MessagePack parse error - %s' % str(exc))
@@ -0,0 +1,89 @@
+"""
+Renderers for the APIs.
+"""
+import re
+
+import msgpack
+import orjson
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+# orjson writes floats under 1e-4 and from 1e16 up unlike json, e.g.
+# 0.00001 and 1e16 for 1e-05 and 1e+16. Output that may hold such floats
+# is rendered again with json. An exponent must end its number token, so
+# hex digests in image paths do not match; rare look-alikes in strings
+# only cost the second render.
+EXPONENT_RE = re.compile(rb'e-?\d+(?:[,\]}]|\Z)')
+SMALL_FLOAT = b'0.0000'
+
+
+def may_hold_float_mismatch(content):
+    """Return whether orjson may have written a float unlike json."""
+    for match in EXPONENT_RE.finditer(content):
+        if content[match.start() - 1:match.start()].isdigit():
+            return True
+
+    start = content.find(SMALL_FLOAT)
+    while start != -1:
+        if content[start - 1:start] in (b':', b'[', b',', b'-'):
+            return True
+        start = content.find(SMALL_FLOAT, start + 1)
+    return False
+
+
+ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME
+)
+
+encoder = encoders.JSONEncoder()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Render JSON with orjson, byte for byte like JSONRenderer.
+
+    Types orjson does not know, such as Decimal and lazy strings, go
+    through the JSON encoder of DRF. Indented output, the non-compact or
+    ASCII settings and data orjson rejects fall back to JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Render data into JSON, returning a bytestring."""
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data, default=encoder.default, option=ORJSON_OPTIONS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if may_hold_float_mismatch(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Escaped like JSONRenderer, to stay a strict javascript subset.
+        return ret.replace(
+            '\u2028'.encode(), b'\\u2028',
+        ).replace(
+            '\u2029'.encode(), b'\\u2029',
+        )
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Render data as MessagePack."""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Render data into MessagePack, returning a bytestring."""
+        if data is None:
+            return b''
+
+        return msgpack.packb(data, default=encoder.default, use_bin_type=True)
@@ -0,0 +1,162 @@
+"""
+Signal handlers for core models.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import BigIntegerField, F, Func, Value
+from django.db.models.functions import Cast, Greatest
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from core.authentication import invalidate_tokens
+from core.models import (
+    RECIPE_ATTR_ID_FIELDS,
+    ImageBlob,
+    Ingredient,
+    Recipe,
+    Tag,
+)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Drop a deleted token from the auth cache."""
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    """Drop the cached tokens of a changed user."""
+    if created:
+        return
+    keys = Token.objects.filter(user=instance).values_list('key', flat=True)
+    invalidate_tokens(keys)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_image(sender, instance, **kwargs):
+    """Drop the deleted recipe's reference to its image."""
+    if instance.image:
+        ImageBlob.objects.release(instance.image.name)
+
+
+def sync_recipe_attr_ids(field_name, instance, action, reverse, pk_set):
+    """Update the id arrays of the recipes whose links changed."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    ids_field = RECIPE_ATTR_ID_FIELDS[field_name]
+    if not reverse:
+        recipes = Recipe.objects.filter(pk=instance.pk)
+    elif action == 'post_clear':
+        # The array still lists the cleared attribute.
+        recipes = Recipe.objects.filter(**{f'{ids_field}__contains': [
+            instance.pk,
+        ]})
+    else:
+        recipes = Recipe.objects.filter(pk__in=pk_set)
+    recipes.sync_attr_ids(fields=[field_name])
+
+    if not reverse:
+        # Keep a later save() of the instance from writing stale ids.
+        setattr(
+            instance, ids_field,
+            recipes.values_list(ids_field, flat=True).get(),
+        )
+
+
+def count_recipe_links(field_name, instance, action, reverse, pk_set):
+    """Update the recipe counts of the attributes whose links changed."""
+    field = Recipe._meta.get_field(field_name)
+    model = field.related_model
+    column = f'{model._meta.model_name}_id'
+    removed_attr = f'_removed_{field_name}'
+
+    if action in ('pre_remove', 'pre_clear'):
+        # Remember the links that exist, as pk_set may list missing ones.
+        own_column, other_column = (
+            (column, 'recipe_id') if reverse else ('recipe_id', column)
+        )
+        links = field.remote_field.through.objects.filter(
+            **{own_column: instance.pk}
+        )
+        if pk_set is not None:
+            links = links.filter(**{f'{other_column}__in': pk_set})
+        setattr(instance, removed_attr, list(
+            links.values_list(other_column, flat=True)
+        ))
+        return
+
+    if action == 'post_add':
+        changed, delta = pk_set, 1
+    elif action in ('post_remove', 'post_clear'):
+        changed, delta = instance.__dict__.pop(removed_attr, []), -1
+    else:
+        return
+    if not changed:
+        return
+
+    if reverse:
+        attrs = model.objects.filter(pk=instance.pk)
+        delta *= len(changed)
+    else:
+        attrs = model.objects.filter(pk__in=changed)
+    attrs.update(recipe_count=Greatest(F('recipe_count') + delta, 0))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Sync the tag_ids arrays and tag recipe counts with the links."""
+    sync_recipe_attr_ids('tags', instance, action, reverse, pk_set)
+    count_recipe_links('tags', instance, action, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_ingredients_changed(
+        sender, instance, action, reverse, pk_set, **kwargs):
+    """Sync the ingredient_ids arrays and counts with the links."""
+    sync_recipe_attr_ids('ingredients', instance, action, reverse, pk_set)
+    count_recipe_links('ingredients', instance, action, reverse, pk_set)
+
+
+@receiver(pre_delete, sender=Recipe)
+def uncount_deleted_recipe(sender, instance, **kwargs):
+    """Decrement the recipe counts of a deleted recipe's attributes."""
+    for field in (Recipe.tags.field, Recipe.ingredients.field):
+        column = f'{field.related_model._meta.model_name}_id'
+        linked = field.remote_field.through.objects.filter(
+            recipe_id=instance.pk,
+        ).values(column)
+        field.related_model.objects.filter(pk__in=linked).update(
+            recipe_count=Greatest(F('recipe_count') - 1, 0),
+        )
+
+
+def remove_attr_id(field_name, pk):
+    """Remove a deleted attribute from the recipe id arrays."""
+    ids_field = RECIPE_ATTR_ID_FIELDS[field_name]
+    Recipe.objects.filter(**{f'{ids_field}__contains': [pk]}).update(**{
+        ids_field: Func(
+            ids_field,
+            Cast(Value(pk), BigIntegerField()),
+            function='array_remove',
+        ),
+    })
+
+
+@receiver(post_delete, sender=Tag)
+def remove_deleted_tag_id(sender, instance, **kwargs):
+    """Drop a deleted tag from recipe tag_ids arrays."""
+    remove_attr_id('tags', instance.pk)
+
+
+@receiver(post_delete, sender=Ingredient)
+def remove_deleted_ingredient_id(sender, instance, **kwargs):
+    """Drop a deleted ingredient from recipe ingredient_ids arrays."""
+    remove_attr_id('ingredients', instance.pk)
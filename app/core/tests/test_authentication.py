@@ -0,0 +1,92 @@
+"""
+Tests for API authentication.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import exceptions, status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import (
+    CachedTokenAuthentication,
+    get_token_cache,
+)
+
+
+ME_URL = reverse('user:me')
+
+
+def create_user(email='test@example.com', password='parola1234'):
+    """Create and return a new user."""
+    return get_user_model().objects.create_user(email, password)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test the cached token authentication."""
+
+    def setUp(self):
+        get_token_cache().clear()
+        self.user = create_user()
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def tearDown(self):
+        get_token_cache().clear()
+
+    def test_authenticate_cached(self):
+        """Test a resolved token is served without queries."""
+        user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(token, self.token)
+
+    def test_invalid_token_not_cached(self):
+        """Test an unknown token fails every time."""
+        for _ in range(2):
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                self.auth.authenticate_credentials('invalid')
+
+    def test_deleted_token_invalidated(self):
+        """Test deleting a token drops it from the cache."""
+        self.auth.authenticate_credentials(self.token.key)
+
+        self.token.delete()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_deactivated_user_invalidated(self):
+        """Test deactivating a user drops their token from the cache."""
+        self.auth.authenticate_credentials(self.token.key)
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_changed_user_invalidated(self):
+        """Test changing a user refreshes the cached user."""
+        self.auth.authenticate_credentials(self.token.key)
+
+        self.user.name = 'New Name'
+        self.user.save()
+        user, token = self.auth.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user.name, 'New Name')
+
+    def test_api_authenticates_with_token(self):
+        """Test the API accepts a cached token on repeated requests."""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+        for _ in range(2):
+            res = client.get(ME_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(res.data['email'], self.user.email)
@@ -1,33 +1,438 @@
 # Test custom Django management commands
 
+from decimal import Decimal
+from io import StringIO
 from unittest.mock import patch
+import json
+import os
+import tempfile
 
-from psycopg2 import OperationalError as Psycopg2OpError
-
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
 
 
-@patch('core.management.commands.wait_for_db.Command.check')
+@patch('core.management.commands.wait_for_db.Command.probe')
 class CommandTests(SimpleTestCase):
     """ Test commands """
 
-    def test_wait_for_db_ready(self, patched_check):
+    def test_wait_for_db_ready(self, patched_probe):
         """Test waiting for database if database is ready"""
-        patched_check.return_value = True
+        out = StringIO()
 
-        call_command('wait_for_db')
+        call_command('wait_for_db', stdout=out)
 
-        patched_check.assert_called_once_with(databases=['default'])
+        patched_probe.assert_called_once()
+        self.assertEqual(patched_probe.call_args.args[0], 'default')
+        self.assertIn('default ready in', out.getvalue())
 
     @patch('time.sleep')
-    def test_wait_for_db_delay(self, patched_sleep, patched_check):
+    def test_wait_for_db_delay(self, patched_sleep, patched_probe):
         """Test for database when getting OperationalError"""
-        patched_check.side_effect = [Psycopg2OpError] * 2 + \
-            [OperationalError] * 3 + [True]
+        patched_probe.side_effect = [OperationalError] * 5 + [None]
+
+        call_command('wait_for_db', max_delay=1, stdout=StringIO())
+
+        self.assertEqual(patched_probe.call_count, 6)
+        delays = [call.args[0] for call in patched_sleep.call_args_list]
+        self.assertEqual(len(delays), 5)
+        for delay, bound in zip(delays, [0.1, 0.2, 0.4, 0.8, 1]):
+            self.assertGreaterEqual(delay, bound / 2)
+            self.assertLessEqual(delay, bound)
+
+    def test_wait_for_db_timeout(self, patched_probe):
+        """Test the command fails once the timeout expired"""
+        patched_probe.side_effect = OperationalError('connection refused')
+        err = StringIO()
+
+        with self.assertRaises(CommandError) as cm:
+            call_command(
+                'wait_for_db', timeout=0, stdout=StringIO(), stderr=err,
+            )
+
+        self.assertIn('default', str(cm.exception))
+        self.assertIn('connection refused', err.getvalue())
+
+    @patch('time.sleep')
+    def test_wait_for_db_aliases_concurrently(
+        self, patched_sleep, patched_probe,
+    ):
+        """Test every alias is probed until it is ready"""
+        down = {'replica1': 2}
+
+        def probe(alias, timeout):
+            if down.get(alias):
+                down[alias] -= 1
+                raise OperationalError()
+
+        patched_probe.side_effect = probe
+        out = StringIO()
+
+        call_command(
+            'wait_for_db', databases=['default', 'replica1'], stdout=out,
+        )
+
+        self.assertIn('default ready in', out.getvalue())
+        self.assertIn('replica1 ready in', out.getvalue())
+        self.assertIn('after 3 attempt(s)', out.getvalue())
+        self.assertEqual(patched_probe.call_count, 4)
+
+
+class WaitForDbProbeTests(SimpleTestCase):
+    """Test probing a real database."""
+    databases = ['default']
+
+    def test_probe_connects(self):
+        """Test the probe connects to the default database"""
+        out = StringIO()
+
+        call_command('wait_for_db', databases=['default'], stdout=out)
+
+        self.assertIn('Database available!', out.getvalue())
+
+
+def write_temp_file(content, suffix):
+    """Write content to a named temporary file and return its path."""
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    return path
+
+
+class ImportRecipesCommandTests(TestCase):
+    """Test the import_recipes command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@example.com',
+            'parola1234',
+        )
+        self.paths = []
+
+    def tearDown(self):
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _jsonl(self, records):
+        """Write records as JSON lines and return the path."""
+        content = '\n'.join(json.dumps(record) for record in records)
+        path = write_temp_file(content, '.jsonl')
+        self.paths.append(path)
+        return path
+
+    def _records(self, count):
+        """Return count sample records sharing a tag."""
+        return [
+            {
+                'title': f'Recipe {i}',
+                'time_minutes': 10,
+                'price': '4.25',
+                'tags': ['Dinner', f'Tag {i}'],
+                'ingredients': [{'name': 'Salt'}],
+            }
+            for i in range(count)
+        ]
+
+    def test_import_jsonl(self):
+        """Test importing recipes with tags and ingredients from JSONL."""
+        Tag.objects.create(user=self.user, name='Dinner')
+        path = self._jsonl(self._records(3))
+        out = StringIO()
+
+        call_command(
+            'import_recipes', path, user=self.user.email, batch_size=2,
+            stdout=out,
+        )
+
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(recipes.count(), 3)
+        self.assertEqual(recipes[0].title, 'Recipe 0')
+        self.assertEqual(recipes[0].price, Decimal('4.25'))
+        self.assertEqual(
+            sorted(tag.name for tag in recipes[2].tags.all()),
+            ['Dinner', 'Tag 2'],
+        )
+        self.assertEqual(Tag.objects.filter(name='Dinner').count(), 1)
+        self.assertEqual(Ingredient.objects.count(), 1)
+        self.assertEqual(recipes[1].ingredients.get().name, 'Salt')
+        self.assertIn('rows/s', out.getvalue())
+
+    def test_import_csv(self):
+        """Test importing recipes from CSV with names split on '|'."""
+        content = (
+            'title,time_minutes,price,description,link,tags,ingredients\n'
+            'Soup,30,3.50,"Hot, tasty",,Dinner|Vegan,Water|Salt\n'
+        )
+        path = write_temp_file(content, '.csv')
+        self.paths.append(path)
+
+        call_command(
+            'import_recipes', path, user=self.user.email, stdout=StringIO(),
+        )
+
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(recipe.description, 'Hot, tasty')
+        self.assertEqual(recipe.link, '')
+        self.assertEqual(recipe.tags.count(), 2)
+        self.assertEqual(recipe.ingredients.count(), 2)
+
+    def test_import_from_stdin(self):
+        """Test importing JSON lines from stdin."""
+        content = '\n'.join(json.dumps(r) for r in self._records(2))
+
+        with patch('sys.stdin', StringIO(content)):
+            call_command(
+                'import_recipes', '-', user=self.user.email,
+                stdout=StringIO(),
+            )
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+
+    def test_import_skips_invalid_records(self):
+        """Test invalid records are reported and skipped."""
+        records = self._records(3)
+        records[1]['time_minutes'] = 'soon'
+        path = self._jsonl(records)
+        err = StringIO()
+
+        call_command(
+            'import_recipes', path, user=self.user.email,
+            stdout=StringIO(), stderr=err,
+        )
+
+        self.assertEqual(Recipe.objects.count(), 2)
+        self.assertIn('Skipping record 2', err.getvalue())
+
+    def test_import_resumes_from_checkpoint(self):
+        """Test records committed by a previous run are skipped."""
+        path = self._jsonl(self._records(5))
+        checkpoint = write_temp_file('3', '.checkpoint')
+        self.paths.append(checkpoint)
+
+        call_command(
+            'import_recipes', path, user=self.user.email,
+            checkpoint=checkpoint, batch_size=1, stdout=StringIO(),
+        )
+
+        titles = set(Recipe.objects.values_list('title', flat=True))
+        self.assertEqual(titles, {'Recipe 3', 'Recipe 4'})
+        with open(checkpoint) as f:
+            self.assertEqual(f.read(), '5')
+
+    def test_import_skips_malformed_lines(self):
+        """Test undecodable lines are skipped and counted by position."""
+        lines = [json.dumps(r) for r in self._records(4)]
+        lines[1] = '{"title": "Broken'
+        lines[2] = '[1, 2]'
+        path = write_temp_file('\n'.join(lines), '.jsonl')
+        self.paths.append(path)
+        checkpoint = write_temp_file('', '.checkpoint')
+        self.paths.append(checkpoint)
+        out, err = StringIO(), StringIO()
+
+        call_command(
+            'import_recipes', path, user=self.user.email,
+            checkpoint=checkpoint, stdout=out, stderr=err,
+        )
+
+        titles = set(Recipe.objects.values_list('title', flat=True))
+        self.assertEqual(titles, {'Recipe 0', 'Recipe 3'})
+        self.assertIn('Skipping record 2', err.getvalue())
+        self.assertIn('Skipping record 3', err.getvalue())
+        self.assertIn('skipped 2 invalid records', out.getvalue())
+        with open(checkpoint) as f:
+            self.assertEqual(f.read(), '4')
+
+    def test_import_missing_file(self):
+        """Test a file that cannot be opened raises an error."""
+        with self.assertRaises(CommandError):
+            call_command(
+                'import_recipes', '/nonexistent.jsonl', user=self.user.email,
+            )
+
+    def test_import_unknown_user(self):
+        """Test importing for an unknown user raises an error."""
+        path = self._jsonl(self._records(1))
+
+        with self.assertRaises(CommandError):
+            call_command('import_recipes', path, user='nobody@example.com')
+
+
+class ExportRecipesCommandTests(TestCase):
+    """Test the export_recipes command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@example.com',
+            'parola1234',
+        )
+
+    def test_export_to_stdout(self):
+        """Test exporting a user's recipes as JSON lines."""
+        for title in ['Soup', 'Salad', 'Stew']:
+            Recipe.objects.create(
+                user=self.user,
+                title=title,
+                time_minutes=10,
+                price=Decimal('2.50'),
+            )
+        out = StringIO()
+
+        call_command(
+            'export_recipes', user=self.user.email, chunk_size=2, stdout=out,
+        )
+
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(
+            [line['title'] for line in lines],
+            ['Stew', 'Salad', 'Soup'],
+        )
+        self.assertEqual(lines[0]['price'], '2.50')
+
+    def test_export_round_trips_through_import(self):
+        """Test an export can be imported for another user."""
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Soup',
+            time_minutes=10,
+            price=Decimal('2.50'),
+        )
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Dinner'))
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'parola1234',
+        )
+        fd, path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        call_command('export_recipes', user=self.user.email, output=path)
+        call_command(
+            'import_recipes', path, user=other.email, stdout=StringIO(),
+        )
+
+        imported = Recipe.objects.get(user=other)
+        self.assertEqual(imported.title, 'Soup')
+        self.assertEqual(imported.tags.get().name, 'Dinner')
+        self.assertEqual(imported.tag_ids, [imported.tags.get().id])
+        self.assertFalse(Recipe.objects.stale_attr_ids().exists())
+        self.assertEqual(imported.tags.get().recipe_count, 1)
+        self.assertEqual(Tag.objects.repair_recipe_counts(), 0)
+
+
+class SyncRecipeAttrIdsCommandTests(TestCase):
+    """Test the sync_recipe_attr_ids command."""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'parola1234',
+        )
+        self.recipe = Recipe.objects.create(
+            user=user,
+            title='Soup',
+            time_minutes=10,
+            price=Decimal('2.50'),
+        )
+        self.tag = Tag.objects.create(user=user, name='Dinner')
+        self.recipe.tags.add(self.tag)
+        Recipe.objects.update(tag_ids=[])
+
+    def test_verify_reports_stale_arrays(self):
+        """Test --verify fails when the arrays differ from the links."""
+        with self.assertRaises(CommandError):
+            call_command('sync_recipe_attr_ids', verify=True)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.tag_ids, [])
+
+    def test_sync_backfills_arrays(self):
+        """Test the command copies the links to the arrays in batches."""
+        out = StringIO()
+
+        call_command('sync_recipe_attr_ids', batch_size=1, stdout=out)
+        call_command('sync_recipe_attr_ids', verify=True, stdout=out)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.tag_ids, [self.tag.id])
+        self.assertIn('in sync', out.getvalue())
+
+
+class BenchmarkAssignedOnlyCommandTests(TestCase):
+    """Test the benchmark_assigned_only command."""
+
+    def test_benchmark_reports_each_size_and_rolls_back(self):
+        """Test a row is printed per size and no data is kept."""
+        out = StringIO()
+
+        call_command(
+            'benchmark_assigned_only', sizes='2,4', tags=3, repeat=1,
+            stdout=out,
+        )
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[1:]], ['2', '4'])
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(get_user_model().objects.exists())
+
+
+class BenchmarkRecipeListCommandTests(TestCase):
+    """Test the benchmark_recipe_list command."""
+
+    def test_benchmark_reports_identical_output_and_rolls_back(self):
+        """Test both serializers are timed and no data is kept."""
+        out = StringIO()
+
+        call_command(
+            'benchmark_recipe_list', rows=5, attrs=2, repeat=1, stdout=out,
+        )
+
+        self.assertIn('Identical output', out.getvalue())
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(get_user_model().objects.exists())
+
+
+class RepairRecipeCountsCommandTests(TestCase):
+    """Test the repair_recipe_counts command."""
+
+    def test_repair_recipe_counts(self):
+        """Test drifted counts are recomputed from the links."""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'parola1234',
+        )
+        recipe = Recipe.objects.create(
+            user=user,
+            title='Soup',
+            time_minutes=10,
+            price=Decimal('2.50'),
+        )
+        used = Tag.objects.create(user=user, name='Dinner')
+        unused = Tag.objects.create(user=user, name='Lunch')
+        salt = Ingredient.objects.create(user=user, name='Salt')
+        recipe.tags.add(used)
+        recipe.ingredients.add(salt)
+        Tag.objects.filter(pk=used.pk).update(recipe_count=5)
+        Tag.objects.filter(pk=unused.pk).update(recipe_count=2)
+        out = StringIO()
 
-        call_command('wait_for_db')
+        call_command('repair_recipe_counts', stdout=out)
 
-        self.assertEqual(patched_check.call_count, 6)
-        patched_check.assert_called_with(databases=['default'])
+        used.refresh_from_db()
+        unused.refresh_from_db()
+        salt.refresh_from_db()
+        self.assertEqual(
+            [used.recipe_count, unused.recipe_count, salt.recipe_count],
+            [1, 0, 1],
+        )
+        self.assertIn('Repaired 2 tags', out.getvalue())
+        self.assertIn('Repaired 0 ingredients', out.getvalue())
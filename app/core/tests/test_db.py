@@ -0,0 +1,191 @@
+"""
+Tests for the database backend, pool and metrics.
+"""
+from unittest.mock import patch
+import os
+
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.db.metrics import observe_acquire
+from core.db.pool import get_pools
+
+
+def copy_connection(**settings):
+    """Return a new connection to the test database."""
+    db = connection.copy()
+    db.settings_dict.update(settings)
+    return db
+
+
+def isolate_pools(test):
+    """Give the test its own pools, closed when it ends."""
+    patcher = patch.dict('core.db.pool._pools', clear=True)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    # Runs after the connections of the test are given back.
+    test.addCleanup(
+        lambda: [pool.close() for pool in get_pools().values()],
+    )
+
+
+def terminate(db):
+    """Make the server drop the connection of db."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_terminate_backend(%s)',
+            [db.connection.get_backend_pid()],
+        )
+
+
+class HealthCheckTests(TestCase):
+    """Test reused connections are checked before use."""
+
+    def _query_after_drop(self, db):
+        """Drop the connection, start a request and run a query."""
+        db.ensure_connection()
+        self.addCleanup(db.close)
+        terminate(db)
+        db.close_if_unusable_or_obsolete()
+        with db.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            return cursor.fetchone()
+
+    def test_dropped_connection_replaced(self):
+        """Test a connection dropped by the server is reopened."""
+        db = copy_connection(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True)
+
+        self.assertEqual(self._query_after_drop(db), (1,))
+
+    def test_dropped_connection_fails_without_checks(self):
+        """Test the query fails when health checks are off."""
+        db = copy_connection(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=False)
+
+        with self.assertRaises(OperationalError):
+            self._query_after_drop(db)
+
+
+class ConnectionPoolTests(TestCase):
+    """Test the connection pool."""
+
+    def setUp(self):
+        isolate_pools(self)
+
+    def _connection(self, **pool):
+        """Return a pooled connection to the test database."""
+        db = copy_connection(CONN_MAX_AGE=0, POOL=pool)
+        self.addCleanup(db.close)
+        return db
+
+    def _pool(self):
+        """Return the pool of the test database."""
+        return get_pools()['default']
+
+    def test_connection_reused(self):
+        """Test closing a connection keeps it open in the pool."""
+        db = self._connection(MAX_SIZE=2)
+        db.ensure_connection()
+        raw = db.connection
+        pool = self._pool()
+        self.assertEqual(pool.in_use, 1)
+
+        db.close()
+
+        self.assertEqual((pool.in_use, pool.idle), (0, 1))
+        self.assertFalse(raw.closed)
+        db.ensure_connection()
+        self.assertIs(db.connection, raw)
+
+    def test_dropped_connection_not_reused(self):
+        """Test a pooled connection dropped by the server is replaced."""
+        db = self._connection(MAX_SIZE=1)
+        db.settings_dict['CONN_HEALTH_CHECKS'] = True
+        db.ensure_connection()
+        raw = db.connection
+        terminate(db)
+        db.close()
+
+        with db.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+        self.assertIsNot(db.connection, raw)
+
+    def test_acquire_times_out_when_saturated(self):
+        """Test a thread gives up when every connection is in use."""
+        first = self._connection(MAX_SIZE=1, TIMEOUT=0.05)
+        second = self._connection(MAX_SIZE=1, TIMEOUT=0.05)
+        first.ensure_connection()
+        pool = self._pool()
+
+        with self.assertRaises(OperationalError):
+            second.ensure_connection()
+
+        self.assertEqual(pool.timeouts, 1)
+        first.close()
+        second.ensure_connection()
+        self.assertEqual(pool.in_use, 1)
+
+
+class MetricsViewTests(TestCase):
+    """Test the metrics endpoint."""
+
+    def test_metrics(self):
+        """Test connection metrics are returned as Prometheus text."""
+        observe_acquire('metrics-test', 0.002)
+        isolate_pools(self)
+        db = copy_connection(CONN_MAX_AGE=0, POOL={})
+        db.ensure_connection()
+        self.addCleanup(db.close)
+
+        with override_settings(METRICS_TOKEN='secret'):
+            res = APIClient().get(
+                reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        body = res.content.decode()
+        pid = os.getpid()
+        self.assertIn(
+            'db_connection_acquire_seconds_bucket'
+            f'{{alias="metrics-test",pid="{pid}",le="0.0025"}} 1',
+            body,
+        )
+        self.assertIn(
+            'db_connection_acquire_seconds_count'
+            f'{{alias="metrics-test",pid="{pid}"}} 1',
+            body,
+        )
+        self.assertIn(
+            f'db_pool_in_use{{alias="default",pid="{pid}"}} 1', body,
+        )
+        self.assertIn(
+            f'db_pool_max_size{{alias="default",pid="{pid}"}} 10', body,
+        )
+
+    def test_metrics_restricted(self):
+        """Test the metrics need the token or a staff user."""
+        url = reverse('metrics')
+        client = APIClient()
+        staff = get_user_model().objects.create_user(
+            'staff@example.com', 'test123', is_staff=True,
+        )
+
+        with override_settings(METRICS_TOKEN='secret'):
+            for auth in ('', 'Bearer wrong', 'secret'):
+                with self.subTest(auth=auth):
+                    res = client.get(url, HTTP_AUTHORIZATION=auth)
+                    self.assertEqual(
+                        res.status_code, status.HTTP_403_FORBIDDEN,
+                    )
+        res = client.get(url, HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        client.force_login(staff)
+        res = client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,76 @@
+"""
+Tests for data migrations.
+"""
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+ATTRS = (('Tag', 'tags'), ('Ingredient', 'ingredients'))
+
+
+class MergeDuplicateRecipeAttrsTests(TransactionTestCase):
+    """Test merging duplicate tags and ingredients."""
+    migrate_from = [('core', '0006_recipe_image')]
+    migrate_to = [('core', '0007_merge_duplicate_recipe_attrs')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.addCleanup(self._migrate_to_latest)
+        executor.migrate(self.migrate_from)
+        self.apps = executor.loader.project_state(self.migrate_from).apps
+
+    def _migrate_to_latest(self):
+        """Restore the schema for the following tests."""
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def _migrate(self):
+        """Apply the merge and return the migrated apps."""
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+        return executor.loader.project_state(self.migrate_to).apps
+
+    def test_duplicates_merged_into_first_row(self):
+        """Test links move to the oldest duplicate and the rest go."""
+        User = self.apps.get_model('core', 'User')
+        Recipe = self.apps.get_model('core', 'Recipe')
+        user = User.objects.create(email='user@example.com')
+        other = User.objects.create(email='other@example.com')
+        recipes = [
+            Recipe.objects.create(
+                user=user, title=f'Recipe {i}', time_minutes=5, price='1.00',
+            )
+            for i in range(3)
+        ]
+        kept = {}
+        for model_name, field_name in ATTRS:
+            model = self.apps.get_model('core', model_name)
+            keep, first, second = (
+                model.objects.create(user=user, name='Salt')
+                for _ in range(3)
+            )
+            unrelated = model.objects.create(user=other, name='Salt')
+            getattr(recipes[0], field_name).add(keep, first)
+            getattr(recipes[1], field_name).add(first)
+            getattr(recipes[2], field_name).add(second)
+            kept[model_name] = (keep.id, unrelated.id)
+
+        apps = self._migrate()
+
+        Recipe = apps.get_model('core', 'Recipe')
+        for model_name, field_name in ATTRS:
+            with self.subTest(model=model_name):
+                model = apps.get_model('core', model_name)
+                keep_id, unrelated_id = kept[model_name]
+                self.assertEqual(
+                    set(model.objects.values_list('id', flat=True)),
+                    {keep_id, unrelated_id},
+                )
+                through = Recipe._meta.get_field(field_name).remote_field
+                links = through.through.objects.values_list(
+                    'recipe_id', f'{model_name.lower()}_id',
+                )
+                self.assertEqual(
+                    sorted(links),
+                    [(recipe.id, keep_id) for recipe in recipes],
+                )
@@ -3,13 +3,24 @@ Tests for models.
 """
 from unittest.mock import patch
 from decimal import Decimal
+from threading import Event, Thread
+import hashlib
+import time
 
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase
 from django.contrib.auth import get_user_model
 
 from core import models
 
 
+def save_as_named(name, content):
+    """Stand in for Storage.save() keeping the requested name."""
+    return name
+
+
 def create_user(email='test@example.com', password='parola1234',):
     """Create and return a new user."""
     return get_user_model().objects.create_user(email, password)
@@ -91,11 +102,253 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(ingredient), ingredient.name)
 
-    @patch('core.models.uuid.uuid4')
-    def test_recipe_file_name_uuid(self, mock_uuid):
-        """Test generating image path."""
-        uuid = 'test-uuid'
-        mock_uuid.return_value = uuid
-        file_path = models.recipe_image_file_path(None, 'example.jpg')
+    def test_get_or_create_by_names(self):
+        """Test getting and creating tags by name in bulk."""
+        user = create_user()
+        other_user = create_user(email='other@example.com')
+        existing = models.Tag.objects.create(user=user, name='Vegan')
+        models.Tag.objects.create(user=other_user, name='Dinner')
+
+        tags = models.Tag.objects.get_or_create_by_names(
+            user,
+            ['Vegan', 'Dinner', 'Vegan'],
+        )
+
+        self.assertEqual([tag.name for tag in tags], ['Vegan', 'Dinner'])
+        self.assertEqual(tags[0], existing)
+        self.assertEqual(tags[1].user, user)
+        self.assertEqual(models.Tag.objects.filter(user=user).count(), 2)
+
+    def test_tag_name_unique_per_user(self):
+        """Test tag names are unique for a user but not across users."""
+        user = create_user()
+        other_user = create_user(email='other@example.com')
+        models.Tag.objects.create(user=user, name='Vegan')
+        models.Tag.objects.create(user=other_user, name='Vegan')
+
+        with self.assertRaises(IntegrityError):
+            models.Tag.objects.create(user=user, name='Vegan')
+
+    def test_recipe_file_name_content_hash(self):
+        """Test generating image path from the image content."""
+        recipe = models.Recipe(
+            image=SimpleUploadedFile('example.JPG', b'image-bytes'),
+        )
+        digest = hashlib.sha256(b'image-bytes').hexdigest()
+
+        file_path = models.recipe_image_file_path(recipe, 'example.JPG')
+
+        self.assertEqual(
+            file_path, f'uploads/recipe/{digest[:2]}/{digest}.jpg',
+        )
+
+    @patch('core.models.default_storage')
+    def test_acquire_existing_image_is_metadata_only(self, mock_storage):
+        """Test storing the same content twice writes one file."""
+        mock_storage.exists.side_effect = [False, True]
+        mock_storage.save.side_effect = save_as_named
+
+        first = models.ImageBlob.objects.acquire(
+            SimpleUploadedFile('a.jpg', b'image-bytes'),
+        )
+        second = models.ImageBlob.objects.acquire(
+            SimpleUploadedFile('b.jpg', b'image-bytes'),
+        )
+
+        self.assertEqual(first.pk, second.pk)
+        mock_storage.save.assert_called_once()
+        second.refresh_from_db()
+        self.assertEqual(second.ref_count, 2)
+
+    @patch('core.models.default_storage')
+    def test_release_deletes_unreferenced_image(self, mock_storage):
+        """Test the files are deleted with the last reference."""
+        mock_storage.exists.return_value = False
+        mock_storage.save.side_effect = save_as_named
+        file = SimpleUploadedFile('a.jpg', b'image-bytes')
+        blob = models.ImageBlob.objects.acquire(file)
+        models.ImageBlob.objects.acquire(file)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.ImageBlob.objects.release(blob.path)
+        mock_storage.delete.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.ImageBlob.objects.release(blob.path)
+        mock_storage.delete.assert_called_once_with(blob.path)
+        self.assertFalse(models.ImageBlob.objects.exists())
+
+    @patch('core.models.default_storage')
+    def test_acquire_follows_storage_name(self, mock_storage):
+        """Test the blob points at the name the storage saved under."""
+        mock_storage.exists.return_value = False
+        mock_storage.save.side_effect = lambda name, content: f'{name}_x'
+
+        blob = models.ImageBlob.objects.acquire(
+            SimpleUploadedFile('a.jpg', b'image-bytes'),
+        )
+
+        name = mock_storage.save.call_args.args[0]
+        self.assertEqual(blob.path, f'{name}_x')
+        blob.refresh_from_db()
+        self.assertEqual(blob.path, f'{name}_x')
+
+    @patch('core.models.default_storage')
+    def test_acquire_after_release_keeps_own_file(self, mock_storage):
+        """Test new content is saved while a released copy awaits delete."""
+        mock_storage.exists.return_value = False
+        mock_storage.save.side_effect = save_as_named
+        file = SimpleUploadedFile('a.jpg', b'image-bytes')
+        released = models.ImageBlob.objects.acquire(file)
+        with self.captureOnCommitCallbacks() as callbacks:
+            models.ImageBlob.objects.release(released.path)
+        mock_storage.exists.return_value = True
+        mock_storage.save.side_effect = lambda name, content: f'{name}_x'
+
+        blob = models.ImageBlob.objects.acquire(file)
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(blob.path, f'{released.path}_x')
+        mock_storage.delete.assert_called_once_with(released.path)
+
+    def test_recipe_attr_ids_follow_links(self):
+        """Test the id arrays follow adds, removes, clears and deletes."""
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=Decimal('1.00'),
+        )
+        other = models.Recipe.objects.create(
+            user=user, title='Stew', time_minutes=5, price=Decimal('1.00'),
+        )
+        tag1 = models.Tag.objects.create(user=user, name='Dinner')
+        tag2 = models.Tag.objects.create(user=user, name='Winter')
+        salt = models.Ingredient.objects.create(user=user, name='Salt')
+
+        recipe.tags.add(tag2, tag1)
+        recipe.ingredients.add(salt)
+        tag1.recipe_set.add(other)
+        self.assertEqual(recipe.tag_ids, [tag1.id, tag2.id])
+
+        recipe.tags.remove(tag2)
+        tag1.recipe_set.clear()
+        salt.delete()
+
+        for obj in (recipe, other):
+            obj.refresh_from_db()
+            self.assertEqual(obj.tag_ids, [])
+        self.assertEqual(recipe.ingredient_ids, [])
+        self.assertFalse(models.Recipe.objects.stale_attr_ids().exists())
+
+    def test_recipe_save_keeps_attr_ids(self):
+        """Test saving an outdated copy does not reset the id arrays."""
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=Decimal('1.00'),
+        )
+        outdated = models.Recipe.objects.get(pk=recipe.pk)
+        tag = models.Tag.objects.create(user=user, name='Dinner')
+        recipe.tags.add(tag)
+
+        outdated.title = 'Hot soup'
+        outdated.save()
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Hot soup')
+        self.assertEqual(recipe.tag_ids, [tag.id])
+        self.assertFalse(models.Recipe.objects.stale_attr_ids().exists())
+
+    def test_attr_save_keeps_recipe_count(self):
+        """Test saving an outdated tag does not reset its recipe count."""
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=Decimal('1.00'),
+        )
+        tag = models.Tag.objects.create(user=user, name='Dinner')
+        recipe.tags.add(tag)
+
+        tag.name = 'Supper'
+        tag.save()
+
+        tag.refresh_from_db()
+        self.assertEqual((tag.name, tag.recipe_count), ('Supper', 1))
+
+    def test_recipe_counts_follow_links(self):
+        """Test recipe counts follow adds, removes, clears and deletes."""
+        user = create_user()
+        recipes = [
+            models.Recipe.objects.create(
+                user=user, title=title, time_minutes=5, price=Decimal('1.00'),
+            )
+            for title in ['Soup', 'Stew', 'Salad']
+        ]
+        tag = models.Tag.objects.create(user=user, name='Dinner')
+        other = models.Tag.objects.create(user=user, name='Winter')
+        salt = models.Ingredient.objects.create(user=user, name='Salt')
+
+        recipes[0].tags.add(tag, other)
+        recipes[0].tags.add(tag)
+        tag.recipe_set.add(recipes[1], recipes[2])
+        recipes[0].ingredients.add(salt)
+        recipes[1].ingredients.add(salt)
+
+        def counts():
+            return [
+                models.Tag.objects.get(pk=tag.pk).recipe_count,
+                models.Tag.objects.get(pk=other.pk).recipe_count,
+                models.Ingredient.objects.get(pk=salt.pk).recipe_count,
+            ]
+
+        self.assertEqual(counts(), [3, 1, 2])
+
+        recipes[2].tags.remove(tag, other)
+        self.assertEqual(counts(), [2, 1, 2])
+        recipes[0].tags.clear()
+        self.assertEqual(counts(), [1, 0, 2])
+        recipes[1].delete()
+        self.assertEqual(counts(), [0, 0, 1])
+        salt.recipe_set.clear()
+        self.assertEqual(counts(), [0, 0, 0])
+
+
+class ImageBlobConcurrencyTests(TransactionTestCase):
+    """Test uploading the same new image concurrently."""
+
+    @patch('core.models.default_storage')
+    def test_concurrent_acquire_of_new_content(self, mock_storage):
+        """Test the second upload waits and references the first blob."""
+        saving = Event()
+        stored = []
+
+        def slow_save(name, content):
+            saving.set()
+            time.sleep(0.3)
+            stored.append(name)
+            return name
+
+        mock_storage.exists.side_effect = lambda name: name in stored
+        mock_storage.save.side_effect = slow_save
+        blobs, errors = [], []
+
+        def upload(filename):
+            try:
+                blobs.append(models.ImageBlob.objects.acquire(
+                    SimpleUploadedFile(filename, b'image-bytes'),
+                ))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        first = Thread(target=upload, args=['a.jpg'])
+        first.start()
+        saving.wait(5)
+        second = Thread(target=upload, args=['b.jpg'])
+        second.start()
+        first.join()
+        second.join()
 
-        self.assertEqual(file_path, f'uploads/recipe/{uuid}.jpg')
+        self.assertEqual(errors, [])
+        self.assertEqual(blobs[0].pk, blobs[1].pk)
+        mock_storage.save.assert_called_once()
+        self.assertEqual(models.ImageBlob.objects.get().ref_count, 2)
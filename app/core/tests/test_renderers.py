@@ -0,0 +1,163 @@
+"""
+Tests for the renderers and parsers.
+"""
+from collections import OrderedDict
+from decimal import Decimal
+from io import BytesIO
+from unittest.mock import patch
+import hashlib
+import datetime
+import uuid
+
+import msgpack
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import FastJSONParser, MessagePackParser
+from core.renderers import FastJSONRenderer, MessagePackRenderer
+
+
+PAYLOADS = [
+    None,
+    [],
+    {'price': Decimal('7.77'), 'coerced': Decimal('1.5')},
+    OrderedDict([('b', 1), ('a', [True, False, None])]),
+    {'title': 'Crème brûlée "dessert" \\ \t\n\x1f\x7f / 🍮'},
+    {'separators': 'line paragraph end'},
+    {'image': 'http://testserver/static/media/uploads/recipe/a.webp'},
+    {
+        'created': datetime.datetime(
+            2022, 1, 2, 3, 4, 5, 6000, tzinfo=datetime.timezone.utc,
+        ),
+        'naive': datetime.datetime(2022, 1, 2, 3, 4, 5),
+        'local': timezone.localtime(timezone.now()),
+        'day': datetime.date(2022, 1, 2),
+        'time': datetime.time(12, 30),
+        'elapsed': datetime.timedelta(minutes=90),
+        'id': uuid.UUID(int=1),
+    },
+    {'lazy': gettext_lazy('This field is required.')},
+    {'floats': [0.1, 5.0, -0.0, 1 / 3, 1e15, 1e16, 1e-5, 2.5e-7, 1e300]},
+    {'number_text': 'Bake 1e5 cakes for 0.00001 seconds, [0.0000]'},
+    {'big': 2 ** 70, 'small': -2 ** 64},
+    1e16,
+    [2.5e-7],
+    {1: 'non string key', None: 'null key'},
+    {'tuple': (1, 2), 'set': {3}},
+]
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """Test FastJSONRenderer renders exactly like JSONRenderer."""
+
+    def test_render_same_bytes(self):
+        """Test payloads render to the bytes of JSONRenderer."""
+        for data in PAYLOADS:
+            with self.subTest(data=data):
+                self.assertEqual(
+                    FastJSONRenderer().render(data),
+                    JSONRenderer().render(data),
+                )
+
+    def test_render_digest_urls_with_orjson(self):
+        """Test image digests in strings do not force a second render."""
+        data = [
+            {'image': (
+                'http://testserver/static/media/uploads/recipe/variants/'
+                f'{hashlib.sha256(str(i).encode()).hexdigest()}-thumb.webp'
+            )}
+            for i in range(100)
+        ]
+        expected = JSONRenderer().render(data)
+
+        with patch.object(
+            JSONRenderer, 'render', side_effect=AssertionError('Fell back.'),
+        ):
+            rendered = FastJSONRenderer().render(data)
+
+        self.assertEqual(rendered, expected)
+
+    def test_render_indent(self):
+        """Test an indent in the accepted media type is honoured."""
+        data = {'title': 'Soup', 'tags': [{'id': 1}]}
+        media_type = 'application/json; indent=4'
+
+        self.assertEqual(
+            FastJSONRenderer().render(data, media_type),
+            JSONRenderer().render(data, media_type),
+        )
+
+    def test_render_unsupported_type_fails(self):
+        """Test unknown types fail like with JSONRenderer."""
+        with self.assertRaises(TypeError):
+            FastJSONRenderer().render({'value': object()})
+
+
+class FastJSONParserTests(SimpleTestCase):
+    """Test FastJSONParser parses like JSONParser."""
+
+    def _parse(self, parser, body):
+        """Parse a request body."""
+        return parser.parse(BytesIO(body), 'application/json', {})
+
+    def test_parse_same_data(self):
+        """Test bodies parse to the data of JSONParser."""
+        bodies = [
+            b'{"title": "Cr\\u00e8me", "price": "7.77", "tags": []}',
+            '{"title": "Crème 🍮"}'.encode(),
+            b'[1, -2.5, 1e-05, true, null]',
+            b'{"big": 123456789012345678901234567890}',
+            b'{"a": 1, "a": 2}',
+        ]
+        for body in bodies:
+            with self.subTest(body=body):
+                self.assertEqual(
+                    self._parse(FastJSONParser(), body),
+                    self._parse(JSONParser(), body),
+                )
+
+    def test_parse_invalid_json_fails(self):
+        """Test malformed and non-strict JSON raise a parse error."""
+        for body in [b'{"title": ', b'{"value": NaN}']:
+            with self.subTest(body=body):
+                with self.assertRaises(ParseError):
+                    self._parse(FastJSONParser(), body)
+
+
+class MessagePackTests(SimpleTestCase):
+    """Test the MessagePack renderer and parser."""
+
+    def test_render_round_trip(self):
+        """Test rendered data unpacks to the JSON representation."""
+        data = {
+            'price': Decimal('7.77'),
+            'title': 'Crème',
+            'tags': [{'id': 1, 'name': 'Vegan'}],
+        }
+
+        body = MessagePackRenderer().render(data)
+
+        self.assertEqual(msgpack.unpackb(body), {
+            'price': 7.77,
+            'title': 'Crème',
+            'tags': [{'id': 1, 'name': 'Vegan'}],
+        })
+
+    def test_parse(self):
+        """Test MessagePack bodies are parsed."""
+        body = msgpack.packb({'title': 'Soup', 'time_minutes': 5})
+
+        data = MessagePackParser().parse(BytesIO(body))
+
+        self.assertEqual(data, {'title': 'Soup', 'time_minutes': 5})
+
+    def test_parse_invalid_fails(self):
+        """Test malformed bodies raise a parse error."""
+        with self.assertRaises(ParseError):
+            MessagePackParser().parse(BytesIO(b'\xc1'))
@@ -0,0 +1,251 @@
+"""
+Tests for routing reads to replicas.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from itertools import cycle
+from unittest.mock import patch
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from core.authentication import CachedTokenAuthentication, token_cache_key
+from core.db.routers import (
+    ReplicaRouter,
+    primary_reads,
+    replica_reads_enabled,
+    set_replica_reads,
+)
+from core.middleware import REPLICA_PIN_COOKIE, ReplicaRoutingMiddleware
+from core.models import Recipe, Tag
+
+RECIPES_URL = reverse('recipe:recipe-list')
+ME_URL = reverse('user:me')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRouterTests(SimpleTestCase):
+    """Test the replica router."""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.addCleanup(set_replica_reads, False)
+
+    def test_reads_from_primary_by_default(self):
+        """Test reads go to the primary unless allowed on replicas."""
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_reads_from_replica_when_allowed(self):
+        """Test allowed reads go to a replica and writes to the primary."""
+        set_replica_reads(True)
+
+        self.assertIn(
+            self.router.db_for_read(Recipe), ['replica1', 'replica2'],
+        )
+        self.assertEqual(self.router.db_for_write(Recipe), 'default')
+
+    def test_primary_reads_block(self):
+        """Test primary_reads overrides replica reads inside the block."""
+        set_replica_reads(True)
+
+        with primary_reads():
+            self.assertEqual(self.router.db_for_read(Recipe), 'default')
+        self.assertTrue(replica_reads_enabled())
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        """Test reads stay on the primary without replicas."""
+        set_replica_reads(True)
+
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_replicas_not_migrated(self):
+        """Test only the primary is migrated."""
+        self.assertTrue(self.router.allow_migrate('default', 'core'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'core'))
+
+    def test_one_replica_per_request(self):
+        """Test every read of a request goes to the same replica."""
+        reads = []
+
+        def view(request):
+            for model in [Recipe, Tag, get_user_model(), Recipe]:
+                reads.append(self.router.db_for_read(model))
+            return HttpResponse()
+
+        view.cls = type('View', (), {'read_from_replica': True})
+        middleware = None
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        with patch(
+            'core.db.routers.random.choice',
+            side_effect=cycle(['replica1', 'replica2']),
+        ):
+            middleware(RequestFactory().get('/'))
+
+        self.assertEqual(len(reads), 4)
+        self.assertEqual(set(reads), {'replica1'})
+
+
+# The primary plays the replica, choosing it shows a read was routed.
+@override_settings(DATABASE_REPLICAS=['default'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingMiddlewareTests(TestCase):
+    """Test which requests read from the replicas."""
+
+    def setUp(self):
+        caches['auth'].clear()
+        caches['replica_pin'].clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'test123',
+        )
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        patcher = patch(
+            'core.db.routers.random.choice', side_effect=lambda dbs: dbs[0],
+        )
+        self.choice = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_list_reads_from_replica(self):
+        """Test reads of opted in views go to a replica."""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(self.choice.called)
+
+    def test_profile_reads_from_replica(self):
+        """Test profile reads are allowed on a replica."""
+        with patch(
+            'core.middleware.set_replica_reads', wraps=set_replica_reads,
+        ) as spy:
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        spy.assert_any_call(True)
+
+    def test_other_views_read_from_primary(self):
+        """Test views that did not opt in read from the primary."""
+        res = self.client.get(reverse('health-check'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(self.choice.called)
+
+    def test_writes_pin_client_to_primary(self):
+        """Test a client reads from the primary right after writing."""
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Soup', 'time_minutes': 5, 'price': Decimal('2.50'),
+        })
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.choice.reset_mock()
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'][0]['title'], 'Soup')
+        self.assertFalse(self.choice.called)
+
+        other = APIClient()
+        other.force_authenticate(self.user)
+        other.get(RECIPES_URL)
+        self.assertTrue(self.choice.called)
+
+    def test_writes_pin_client_without_cookies(self):
+        """Test a token client that drops cookies is pinned as well."""
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Soup', 'time_minutes': 5, 'price': Decimal('2.50'),
+        })
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.client.cookies.clear()
+        self.choice.reset_mock()
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'][0]['title'], 'Soup')
+        self.assertFalse(self.choice.called)
+
+    def test_pin_expires(self):
+        """Test reads go back to the replicas once the pin expired."""
+        self.client.patch(ME_URL, {'name': 'New name'})
+        self.choice.reset_mock()
+
+        later = time.time() + 10
+        with patch(
+            'django.core.signing.time.time', return_value=later,
+        ), patch(
+            'django.core.cache.backends.db.timezone.now',
+            return_value=timezone.now() + timedelta(seconds=10),
+        ):
+            self.client.get(RECIPES_URL)
+
+        self.assertTrue(self.choice.called)
+
+    def test_forged_pin_ignored(self):
+        """Test an unsigned pin cookie does not pin the client."""
+        self.client.cookies[REPLICA_PIN_COOKIE] = '1'
+
+        self.client.get(RECIPES_URL)
+
+        self.assertTrue(self.choice.called)
+
+    def test_tokens_resolved_on_primary(self):
+        """Test a lagging replica cannot revive a revoked token."""
+        token = Token.objects.get(user=self.user)
+        calls = []
+
+        def lagging(auth, key):
+            calls.append(replica_reads_enabled())
+            if replica_reads_enabled():
+                return token.user, token
+            raise AuthenticationFailed()
+
+        token.delete()
+        with patch(
+            'rest_framework.authentication.TokenAuthentication.'
+            'authenticate_credentials',
+            lagging,
+        ):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(calls, [False])
+        self.assertIsNone(caches['auth'].get(token_cache_key(token.key)))
+
+    def test_new_token_read_from_primary(self):
+        """Test a token missing on a lagging replica is read from primary."""
+        token = Token.objects.get(user=self.user)
+
+        reads = []
+
+        def db_for_read(router, model, **hints):
+            reads.append(replica_reads_enabled())
+            return 'default'
+
+        set_replica_reads(True)
+        self.addCleanup(set_replica_reads, False)
+        with patch.object(ReplicaRouter, 'db_for_read', db_for_read):
+            user, _ = CachedTokenAuthentication().authenticate_credentials(
+                token.key,
+            )
+
+        self.assertEqual(user, self.user)
+        self.assertTrue(reads)
+        self.assertNotIn(True, reads)
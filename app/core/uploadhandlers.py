@@ -0,0 +1,40 @@
+"""
+File upload handlers.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+def file_sha256(file):
+    """Return the SHA-256 hex digest of a file."""
+    digest = getattr(file, 'sha256', None)
+    if digest is not None:
+        return digest
+
+    sha256 = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
+
+
+class HashingTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Stream uploads to a temporary file, hashing them on the way."""
+
+    def new_file(self, *args, **kwargs):
+        """Start a new file and its digest."""
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        """Hash and write a chunk of the file."""
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        """Attach the digest to the completed file."""
+        file = super().file_complete(file_size)
+        file.sha256 = self.sha256.hexdigest()
+        return file
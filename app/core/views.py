@@ -1,11 +1,40 @@
 """
 Core viewa for app.
 """
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from core.db.metrics import render_metrics
+
 
 @api_view(['GET'])
 def health_check(request):
     """Returns succesful response."""
     return Response({'healthy': True})
+
+
+def metrics_allowed(request):
+    """Return whether the request may read the metrics."""
+    if request.user.is_staff:
+        return True
+    token = settings.METRICS_TOKEN
+    return bool(token) and hmac.compare_digest(
+        request.headers.get('Authorization', ''), f'Bearer {token}',
+    )
+
+
+@require_GET
+def metrics(request):
+    """Returns the metrics of this process for Prometheus."""
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_metrics(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,58 @@
+"""
+Async read views for recipe APIs.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from rest_framework.permissions import SAFE_METHODS
+
+READ_ACTIONS = {'list', 'retrieve'}
+
+
+def run_read(view, request, *args, **kwargs):
+    """Run a read request with its own database connection."""
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        # Encode in the worker too, rather than on the shared sync thread.
+        response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+class AsyncReadMixin:
+    """
+    Serve list and retrieve as coroutines when ASYNC_READ_VIEWS is set.
+
+    Django 4.0 has no async ORM, so safe requests to the list and detail
+    routes run in the worker threads of the event loop, each with its own
+    database connection, instead of waiting their turn on the one thread
+    that runs sync views under ASGI. Writes still run on that thread.
+    """
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        """Return an async view for routes that list or retrieve."""
+        view = super().as_view(actions, **initkwargs)
+        if not (
+            settings.ASYNC_READ_VIEWS and
+            READ_ACTIONS.intersection((actions or {}).values())
+        ):
+            return view
+
+        read = sync_to_async(
+            functools.partial(run_read, view), thread_sensitive=False,
+        )
+        write = sync_to_async(view)
+
+        @functools.wraps(view)
+        async def async_view(request, *args, **kwargs):
+            if request.method in SAFE_METHODS:
+                return await read(request, *args, **kwargs)
+            return await write(request, *args, **kwargs)
+
+        return async_view
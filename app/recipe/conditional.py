@@ -0,0 +1,79 @@
+"""
+Conditional GET support for recipe APIs.
+"""
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+
+def get_collection_version(user):
+    """Return the version of the user's recipes, tags and ingredients."""
+    return get_user_model().objects.filter(
+        pk=user.pk,
+    ).values_list('collection_version', flat=True).first()
+
+
+def bump_collection_version(user):
+    """Mark the user's recipes, tags and ingredients as changed."""
+    get_user_model().objects.filter(pk=user.pk).update(
+        collection_version=F('collection_version') + 1,
+    )
+
+
+class ConditionalGetMixin:
+    """
+    Tag responses with an ETag derived from the collection version.
+
+    Every successful write through the view set bumps the version, so a
+    request carrying the current ETag is answered with 304 Not Modified
+    before the recipe tables are queried.
+    """
+
+    def get_etag(self, request):
+        """Return the ETag of the requested representation."""
+        version = get_collection_version(request.user)
+        key = '\n'.join([
+            str(request.user.pk),
+            str(version),
+            request.get_full_path(),
+            request.accepted_media_type,
+            # Image variant URLs depend on the formats the client accepts.
+            request.headers.get('Accept', ''),
+        ])
+        return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        """Return 304 if the client has the current representation."""
+        etag = self.get_etag(request)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Accept', 'Authorization'])
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """List the collection unless it is unchanged."""
+        return self.conditional_response(
+            request, super().list, *args, **kwargs,
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Bump the collection version after a successful write."""
+        if (
+            request.method not in SAFE_METHODS and
+            status.is_success(response.status_code)
+        ):
+            bump_collection_version(request.user)
+
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,47 @@
+"""
+Streaming export of recipes.
+"""
+import json
+
+from django.db.models import prefetch_related_objects
+
+from rest_framework.utils import encoders
+
+from recipe.serializers import RecipeDetailSerializer
+
+
+EXPORT_CHUNK_SIZE = 500
+
+
+def iter_chunks(queryset, chunk_size):
+    """Yield lists of rows read through a server-side cursor."""
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_ndjson(queryset, context=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield recipes as newline-delimited JSON, one chunk at a time."""
+    for chunk in iter_chunks(queryset, chunk_size):
+        serializer = RecipeDetailSerializer(
+            chunk, many=True, context=context or {},
+        )
+        prefetch_related_objects(chunk, *[
+            name for name in ('tags', 'ingredients')
+            if name in serializer.child.fields
+        ])
+        data = serializer.data
+        yield ''.join(
+            json.dumps(
+                item,
+                cls=encoders.JSONEncoder,
+                ensure_ascii=False,
+                separators=(',', ':'),
+            ) + '\n'
+            for item in data
+        )
@@ -0,0 +1,135 @@
+"""
+Resized image variants for recipes.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from PIL import Image, ImageOps, features
+
+from core.models import (
+    ImageBlob,
+    Recipe,
+)
+from recipe.conditional import bump_collection_version
+
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = os.path.join('uploads', 'recipe', 'variants')
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+_executor = None
+
+
+def render_variants(source_path, dest_dir, stem, sizes):
+    """Write a WebP and a JPEG copy of an image for every size."""
+    os.makedirs(dest_dir, exist_ok=True)
+    variants = {}
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for name, max_size in sizes.items():
+            resized = image.copy()
+            resized.thumbnail((max_size, max_size))
+            variants[name] = {}
+            for key, (image_format, extension) in VARIANT_FORMATS.items():
+                if key == 'webp' and not features.check('webp'):
+                    continue
+                filename = f'{stem}-{name}.{extension}'
+                resized.save(
+                    os.path.join(dest_dir, filename), image_format,
+                    quality=settings.IMAGE_VARIANT_QUALITY,
+                )
+                variants[name][key] = os.path.join(VARIANTS_DIR, filename)
+
+    return variants
+
+
+def get_executor():
+    """Return the process pool, starting it on first use."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_VARIANT_WORKERS,
+        )
+    return _executor
+
+
+def discard_executor(executor):
+    """Drop a broken process pool so the next use starts a new one."""
+    global _executor
+    if _executor is executor:
+        _executor = None
+    executor.shutdown(wait=False)
+
+
+def save_variants(image_name, variants):
+    """Store the variants on the image and the recipes using it."""
+    ImageBlob.objects.filter(path=image_name).update(variants=variants)
+    recipes = Recipe.objects.filter(image=image_name)
+    recipes.update(image_variants=variants)
+    for user in get_user_model().objects.filter(recipe__in=recipes).distinct():
+        bump_collection_version(user)
+
+
+def _variants_done(image_name, future):
+    """Save the result of a finished worker."""
+    try:
+        save_variants(image_name, future.result())
+    except Exception:
+        logger.exception('Generating variants of %s failed.', image_name)
+    finally:
+        # Runs on the executor's thread, outside any request cycle.
+        connection.close()
+
+
+def generate_variants(image_name):
+    """Render the variants of an image, in the pool if configured."""
+    args = (
+        default_storage.path(image_name),
+        default_storage.path(VARIANTS_DIR),
+        os.path.splitext(os.path.basename(image_name))[0],
+        settings.RECIPE_IMAGE_VARIANTS,
+    )
+    if not settings.IMAGE_VARIANT_WORKERS:
+        save_variants(image_name, render_variants(*args))
+        return
+
+    for attempt in range(2):
+        executor = get_executor()
+        try:
+            future = executor.submit(render_variants, *args)
+            break
+        except BrokenProcessPool:
+            # A worker died, for example killed while resizing a huge image.
+            logger.exception('Image variant pool is broken, restarting it.')
+            discard_executor(executor)
+    else:
+        return
+    future.add_done_callback(partial(_variants_done, image_name))
+
+
+def schedule_variants(image_name):
+    """Generate the variants of an image once it is committed."""
+    transaction.on_commit(partial(generate_variants, image_name))
+
+
+def preferred_format(request, files):
+    """Return the stored variant format the client accepts best."""
+    if (
+        'webp' in files and
+        request is not None and
+        'image/webp' in request.headers.get('Accept', '')
+    ):
+        return 'webp'
+    return 'jpeg'
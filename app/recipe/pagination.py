@@ -0,0 +1,180 @@
+"""
+Pagination for recipe APIs.
+"""
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+def _reverse_ordering(ordering):
+    """Return the ordering tuple with every direction flipped."""
+    return tuple(
+        field[1:] if field.startswith('-') else f'-{field}'
+        for field in ordering
+    )
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Paginate recipes with an opaque cursor on the id, newest first."""
+    ordering = '-id'
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+    def decode_cursor(self, request):
+        """Return the cursor, 404 unless its position is an id."""
+        cursor = super().decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return cursor
+        try:
+            return cursor._replace(position=int(cursor.position))
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination keyed on every field of the ordering.
+
+    The ordering must be unique, so the cursor stores the values of all
+    ordering fields for the last row and the next page is fetched with a
+    row comparison instead of an offset.
+    """
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return the page of rows following the cursor position."""
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            reverse = self.cursor.reverse
+            current_position = self.cursor.position
+
+        ordering = self.ordering
+        if reverse:
+            ordering = _reverse_ordering(ordering)
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            queryset = self._filter_after_position(
+                queryset, ordering, current_position,
+            )
+
+        # Fetch an extra row to find out if another page follows this one.
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering,
+            )
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def _filter_after_position(self, queryset, ordering, position):
+        """Return the rows after position, 404 for a tampered cursor."""
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise ValueError('Cursor does not match the ordering.')
+            values = [
+                self._get_ordering_field(queryset, field).to_python(value)
+                for field, value in zip(ordering, values)
+            ]
+            return queryset.filter(
+                self._get_position_filter(ordering, values)
+            )
+        except (ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _get_ordering_field(self, queryset, field):
+        """Return the model or annotation field ordered on."""
+        attr = field.lstrip('-')
+        if attr in queryset.query.annotations:
+            return queryset.query.annotations[attr].output_field
+        return queryset.model._meta.get_field(attr)
+
+    def _get_position_filter(self, ordering, values):
+        """Return a filter matching the rows after values in ordering."""
+        query = None
+        for field, value in reversed(list(zip(ordering, values))):
+            if value is None:
+                raise ValueError('Cursor values cannot be null.')
+            attr = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            after = Q(**{f'{attr}__{lookup}': value})
+            if query is not None:
+                after |= Q(**{attr: value}) & query
+            query = after
+
+        return query
+
+    def _get_position_from_instance(self, instance, ordering):
+        """Return the cursor position of a row as a JSON list."""
+        values = []
+        for field in ordering:
+            attr = field.lstrip('-')
+            if isinstance(instance, dict):
+                values.append(instance[attr])
+            else:
+                values.append(getattr(instance, attr))
+
+        return json.dumps(values)
+
+
+class RecipeAttrCursorPagination(KeysetCursorPagination):
+    """Paginate tags and ingredients on (name, id), by descending name."""
+    ordering = ('-name', '-id')
+
+
+class RecipeSearchCursorPagination(KeysetCursorPagination):
+    """Paginate search results on (rank, id), best match first."""
+    ordering = ('-rank', '-id')
+
+
+class RecipeAttrCountCursorPagination(KeysetCursorPagination):
+    """Paginate tags and ingredients on (recipe_count, id), most used first."""
+    ordering = ('-recipe_count', '-id')
+
+
+class RecipeAttrSearchCursorPagination(KeysetCursorPagination):
+    """Paginate autocomplete matches on (similarity, id), closest first."""
+    ordering = ('-similarity', '-id')
+    page_size = settings.AUTOCOMPLETE_PAGE_SIZE
@@ -0,0 +1,26 @@
+"""
+Renderers for recipe APIs.
+"""
+import json
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils import encoders
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Render data as a single line of newline-delimited JSON."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Return the data as one JSON line."""
+        if data is None:
+            return b''
+        line = json.dumps(
+            data,
+            cls=encoders.JSONEncoder,
+            ensure_ascii=False,
+            separators=(',', ':'),
+        )
+        return f'{line}\n'.encode()
@@ -1,13 +1,24 @@
 """
 Serializers for rexipe APIs.
 """
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils.translation import gettext as _
+
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
 from core.models import (
+    ImageBlob,
     Recipe,
     Tag,
     Ingredient,
 )
+from recipe.images import preferred_format
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -15,8 +26,8 @@ class IngredientSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
-        fields = ['name', 'id']
-        read_only_fields = ['id']
+        fields = ['name', 'id', 'recipe_count']
+        read_only_fields = ['id', 'recipe_count']
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -24,43 +35,131 @@ class TagSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Tag
-        fields = ['id', 'name']
-        read_only_fields = ['id']
+        fields = ['id', 'name', 'recipe_count']
+        read_only_fields = ['id', 'recipe_count']
+
+
+def variant_urls(variants, request):
+    """Return the URL of each image variant in the accepted format."""
+    urls = {}
+    for name, files in variants.items():
+        url = default_storage.url(files[preferred_format(request, files)])
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        urls[name] = url
+    return urls
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Serializer for creating recipes in bulk."""
+
+    def to_internal_value(self, data):
+        """Reject batches larger than the configured maximum."""
+        max_size = settings.RECIPE_BULK_MAX_SIZE
+        if isinstance(data, list) and len(data) > max_size:
+            message = _('Ensure this list has no more than %(max)d items.')
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    message % {'max': max_size},
+                ],
+            })
+
+        return super().to_internal_value(data)
+
+    def _link_attrs(self, recipes, attrs_lists, model, field_name):
+        """Get or create the named objects and link them to recipes."""
+        auth_user = self.context['request'].user
+        names = [attr['name'] for attrs in attrs_lists for attr in attrs]
+        objs = {
+            obj.name: obj
+            for obj in model.objects.get_or_create_by_names(auth_user, names)
+        }
+        through = getattr(Recipe, field_name).through
+        column = f'{model._meta.model_name}_id'
+        links = {
+            (recipe.id, objs[attr['name']].id)
+            for recipe, attrs in zip(recipes, attrs_lists)
+            for attr in attrs
+        }
+        through.objects.bulk_create(
+            [
+                through(recipe_id=recipe_id, **{column: obj_id})
+                for recipe_id, obj_id in links
+            ],
+            ignore_conflicts=True,
+        )
+        # Bulk inserts send no m2m_changed, so sync the id arrays and
+        # the recipe counts here.
+        Recipe.objects.filter(
+            pk__in=[recipe.id for recipe in recipes],
+        ).sync_attr_ids(fields=[field_name])
+        model.objects.add_recipe_counts(
+            Counter(obj_id for _, obj_id in links),
+        )
+
+    @transaction.atomic
+    def create(self, validated_data):
+        """Create the recipes and their links with bulk inserts."""
+        tags = [attrs.pop('tags', []) for attrs in validated_data]
+        ingredients = [
+            attrs.pop('ingredients', []) for attrs in validated_data
+        ]
+        recipes = Recipe.objects.bulk_create(
+            [Recipe(**attrs) for attrs in validated_data]
+        )
+        self._link_attrs(recipes, tags, Tag, 'tags')
+        self._link_attrs(recipes, ingredients, Ingredient, 'ingredients')
+        prefetch_related_objects(recipes, 'tags', 'ingredients')
+
+        return recipes
 
 
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializer for recipes."""
     tags = TagSerializer(many=True, required=False)
     ingredients = IngredientSerializer(many=True, required=False)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = [
             'id', 'title', 'time_minutes', 'price', 'link', 'tags',
-            'ingredients',
+            'ingredients', 'image_variants',
         ]
         read_only_fields = ['id']
+        list_serializer_class = RecipeListSerializer
+
+    def __init__(self, *args, **kwargs):
+        """Drop the fields left out of the 'fields' context entry."""
+        super().__init__(*args, **kwargs)
+        selected = self.context.get('fields')
+        if selected is not None:
+            for name in set(self.fields) - set(selected):
+                self.fields.pop(name)
+
+    def get_image_variants(self, recipe):
+        """Return the URL of each variant in the accepted format."""
+        return variant_urls(recipe.image_variants, self.context.get('request'))
 
     def _get_or_create_tags(self, tags, recipe):
         """Handle getting or creating tags as needed."""
         auth_user = self.context['request'].user
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user=auth_user,
-                **tag,
-            )
-            recipe.tags.add(tag_obj)
+        tag_objs = Tag.objects.get_or_create_by_names(
+            auth_user,
+            [tag['name'] for tag in tags],
+        )
+        recipe.tags.add(*tag_objs)
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """Handle getting or creating ingredients as needed."""
         auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user=auth_user,
-                **ingredient,
-            )
-            recipe.ingredients.add(ingredient_obj)
+        ingredient_objs = Ingredient.objects.get_or_create_by_names(
+            auth_user,
+            [ingredient['name'] for ingredient in ingredients],
+        )
+        recipe.ingredients.add(*ingredient_objs)
 
+    @transaction.atomic
     def create(self, validated_data):
         """Override create a recipe."""
         tags = validated_data.pop('tags', [])
@@ -71,6 +170,7 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Update recipe."""
         tags = validated_data.pop('tags', None)
@@ -97,6 +197,78 @@ class RecipeDetailSerializer(RecipeSerializer):
         fields = RecipeSerializer.Meta.fields + ['description', 'image']
 
 
+class RecipeRowListSerializer(serializers.ListSerializer):
+    """Serialize a page of recipe rows with one query per relation."""
+
+    def _related_rows(self, recipe_ids, field_name, serializer_class):
+        """Return the related objects of each recipe as dicts, by id."""
+        field = Recipe._meta.get_field(field_name)
+        model_name = field.related_model._meta.model_name
+        names = serializer_class.Meta.fields
+        links = field.remote_field.through.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).order_by('recipe_id', f'{model_name}_id').values_list(
+            'recipe_id', *[f'{model_name}__{name}' for name in names],
+        )
+        grouped = defaultdict(list)
+        for recipe_id, *values in links:
+            grouped[recipe_id].append(dict(zip(names, values)))
+        return grouped
+
+    def to_representation(self, data):
+        """Build the RecipeSerializer output from values() rows."""
+        rows = list(data)
+        selected = self.context.get('fields')
+        fields = [
+            name for name in RecipeSerializer.Meta.fields
+            if selected is None or name in selected
+        ]
+        recipe_ids = [row['id'] for row in rows]
+        related = {
+            name: self._related_rows(recipe_ids, name, serializer_class)
+            for name, serializer_class in [
+                ('tags', TagSerializer),
+                ('ingredients', IngredientSerializer),
+            ]
+            if name in fields
+        }
+        price = RecipeSerializer().fields['price']
+        request = self.context.get('request')
+
+        items = []
+        for row in rows:
+            item = {}
+            for name in fields:
+                if name in related:
+                    item[name] = related[name].get(row['id'], [])
+                elif name == 'price':
+                    item[name] = price.to_representation(row[name])
+                elif name == 'image_variants':
+                    item[name] = variant_urls(row[name], request)
+                else:
+                    item[name] = row[name]
+            items.append(item)
+        return items
+
+
+class RecipeRowSerializer(serializers.BaseSerializer):
+    """Read-only serializer for recipe rows from values()."""
+
+    class Meta:
+        list_serializer_class = RecipeRowListSerializer
+
+    @classmethod
+    def row_fields(cls, selected=None):
+        """Return the columns needed for the selected fields."""
+        return [
+            name for name in RecipeSerializer.Meta.fields
+            if name == 'id' or (
+                name not in ('tags', 'ingredients') and
+                (selected is None or name in selected)
+            )
+        ]
+
+
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading images to recipes."""
 
@@ -105,3 +277,16 @@ class RecipeImageSerializer(serializers.ModelSerializer):
         fields = ['id', 'image']
         read_only_fields = ['id']
         extra_kwargs = {'image': {'required': 'True'}}
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        """Point the recipe at the stored copy of the image."""
+        previous = instance.image.name
+        blob = ImageBlob.objects.acquire(validated_data['image'])
+        instance.image = blob.path
+        instance.image_variants = blob.variants
+        instance.save(update_fields=['image', 'image_variants'])
+        if previous:
+            ImageBlob.objects.release(previous)
+
+        return instance
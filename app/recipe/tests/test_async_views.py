@@ -0,0 +1,200 @@
+"""
+Tests for the async read views.
+"""
+from decimal import Decimal
+from unittest.mock import patch
+import asyncio
+import json
+import threading
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import (
+    AsyncRequestFactory,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from app.asgi import application
+from core.models import Recipe, Tag
+from recipe.views import RecipeViewSet, TagViewSet
+
+RECIPES_URL = reverse('recipe:recipe-list')
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('7.77'),
+    }
+    defaults.update(**params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+@override_settings(ASYNC_READ_VIEWS=True)
+class AsyncReadViewTests(TransactionTestCase):
+    """Test list and retrieve run as coroutines in worker threads."""
+
+    def setUp(self):
+        # Worker threads would keep their connections to the test database.
+        patcher = patch.dict(connection.settings_dict, {'CONN_MAX_AGE': 0})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = AsyncRequestFactory()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'test123',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.recipe = create_recipe(self.user, title='Soup')
+
+    def _request(self, view, method='get', path=RECIPES_URL, **kwargs):
+        """Run an authenticated request through an async view."""
+        request = getattr(self.factory, method)(
+            path, authorization=f'Token {self.token.key}', **kwargs,
+        )
+        return async_to_sync(view)(request)
+
+    def test_read_routes_are_async(self):
+        """Test only routes with list or retrieve become coroutines."""
+        self.assertTrue(asyncio.iscoroutinefunction(
+            RecipeViewSet.as_view({'get': 'list', 'post': 'create'}),
+        ))
+        self.assertTrue(asyncio.iscoroutinefunction(
+            TagViewSet.as_view({'get': 'list'}),
+        ))
+        self.assertFalse(asyncio.iscoroutinefunction(
+            RecipeViewSet.as_view({'get': 'export'}),
+        ))
+        self.assertFalse(asyncio.iscoroutinefunction(
+            TagViewSet.as_view({'patch': 'partial_update'}),
+        ))
+
+    @override_settings(ASYNC_READ_VIEWS=False)
+    def test_sync_views_by_default(self):
+        """Test the views stay sync without ASYNC_READ_VIEWS."""
+        self.assertFalse(asyncio.iscoroutinefunction(
+            RecipeViewSet.as_view({'get': 'list'}),
+        ))
+
+    def test_list_and_retrieve(self):
+        """Test the async views return the recipes."""
+        res = self._request(RecipeViewSet.as_view({'get': 'list'}))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['title'], 'Soup')
+
+        request = self.factory.get(
+            f'{RECIPES_URL}{self.recipe.id}/',
+            authorization=f'Token {self.token.key}',
+        )
+        res = async_to_sync(RecipeViewSet.as_view({'get': 'retrieve'}))(
+            request, pk=self.recipe.id,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['id'], self.recipe.id)
+
+    def test_create_through_async_route(self):
+        """Test writes still work on the async list route."""
+        view = RecipeViewSet.as_view({'get': 'list', 'post': 'create'})
+
+        res = self._request(
+            view, 'post',
+            data={'title': 'Pie', 'time_minutes': 5, 'price': '1.50'},
+            content_type='application/json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Recipe.objects.filter(title='Pie').exists())
+
+    def test_reads_run_concurrently(self):
+        """Test reads in flight at the same time use separate threads."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        view = TagViewSet.as_view({'get': 'list'})
+        barrier = threading.Barrier(2, timeout=5)
+        list_tags = TagViewSet.list
+
+        def wait_for_other(viewset, request, *args, **kwargs):
+            barrier.wait()
+            return list_tags(viewset, request, *args, **kwargs)
+
+        async def read_twice():
+            return await asyncio.gather(*[
+                view(self.factory.get(
+                    reverse('recipe:tag-list'),
+                    authorization=f'Token {self.token.key}',
+                ))
+                for _ in range(2)
+            ])
+
+        with patch.object(TagViewSet, 'list', wait_for_other):
+            responses = async_to_sync(read_twice)()
+
+        for res in responses:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(res.data['results'][0]['name'], 'Vegan')
+
+
+class ASGIApplicationTests(TransactionTestCase):
+    """Test requests served by the ASGI application."""
+
+    def setUp(self):
+        patcher = patch.dict(connection.settings_dict, {'CONN_MAX_AGE': 0})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'test123',
+        )
+        self.token = Token.objects.create(user=self.user)
+
+    def _get(self, path):
+        """Return the messages sent for an authenticated GET request."""
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'query_string': b'',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', f'Token {self.token.key}'.encode()),
+            ],
+            'server': ('testserver', 80),
+            'client': ('127.0.0.1', 12345),
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        async_to_sync(application)(scope, receive, send)
+        return messages
+
+    def test_export_streams_through_asgi(self):
+        """Test the export body is read from the database off the loop."""
+        for title in ['Soup', 'Stew', 'Salad']:
+            create_recipe(self.user, title=title)
+
+        messages = self._get(EXPORT_URL)
+
+        self.assertEqual(messages[0]['status'], status.HTTP_200_OK)
+        self.assertEqual(messages[-1], {'type': 'http.response.body'})
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        self.assertEqual(
+            [json.loads(line)['title'] for line in body.splitlines()],
+            ['Salad', 'Stew', 'Soup'],
+        )
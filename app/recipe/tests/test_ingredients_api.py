@@ -2,6 +2,7 @@
 Test for ingredients API.
 """
 from decimal import Decimal
+from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
 from django.test import TestCase
@@ -15,6 +16,7 @@ from core.models import (
     Recipe,
 )
 
+from recipe.pagination import RecipeAttrCursorPagination
 from recipe.serializers import IngredientSerializer
 
 
@@ -78,7 +80,7 @@ class PrivateIngredientApiTests(TestCase):
         serializer = IngredientSerializer(ingredients, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         """Test list of ingredients is limited to authenticated user."""
@@ -89,9 +91,9 @@ class PrivateIngredientApiTests(TestCase):
         res = self.client.get(INGREDIENTS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], ingredient.name)
-        self.assertEqual(res.data[0]['id'], ingredient.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], ingredient.name)
+        self.assertEqual(res.data['results'][0]['id'], ingredient.id)
 
     def test_update_ingredient(self):
         """Test updating an ingredient."""
@@ -129,12 +131,13 @@ class PrivateIngredientApiTests(TestCase):
         recipe.ingredients.add(ingredient1)
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
+        ingredient1.refresh_from_db()
         s1 = IngredientSerializer(ingredient1)
         s2 = IngredientSerializer(ingredient2)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
 
     def test_filter_ingredients_unique(self):
         """Test filtered ingredients returns a unique list."""
@@ -147,4 +150,58 @@ class PrivateIngredientApiTests(TestCase):
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_ingredients_paginated_by_name_and_id(self):
+        """Test following the cursor returns every ingredient once."""
+        for name in ['Salt', 'Flour', 'Sugar', 'Eggs', 'Milk']:
+            Ingredient.objects.create(user=self.user, name=name)
+
+        res = self.client.get(INGREDIENTS_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [ingredient['id'] for ingredient in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            ids.extend(ingredient['id'] for ingredient in res.data['results'])
+
+        expected = Ingredient.objects.order_by('-name', '-id')
+        self.assertEqual(ids, [ingredient.id for ingredient in expected])
+
+    def test_ingredients_page_size_limited(self):
+        """Test the requested page size is capped by the maximum."""
+        for name in ['Salt', 'Flour', 'Eggs']:
+            Ingredient.objects.create(user=self.user, name=name)
+
+        with patch.object(RecipeAttrCursorPagination, 'max_page_size', 2):
+            res = self.client.get(INGREDIENTS_URL, {'page_size': 1000})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+
+    def test_ingredient_delete_changes_etag(self):
+        """Test deleting an ingredient makes the previous ETag stale."""
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        etag = self.client.get(INGREDIENTS_URL)['ETag']
+        res = self.client.get(INGREDIENTS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.delete(detail_url(ingredient.id))
+        res = self.client.get(INGREDIENTS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [])
+
+    def test_autocomplete_ingredients(self):
+        """Test q finds ingredients by the start of a word."""
+        garlic = Ingredient.objects.create(user=self.user, name='Garlic')
+        Ingredient.objects.create(user=self.user, name='Ginger')
+
+        res = self.client.get(INGREDIENTS_URL, {'q': 'garl'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [ingredient['id'] for ingredient in res.data['results']],
+            [garlic.id],
+        )
@@ -1,32 +1,60 @@
 """
 Test for recipe APIs.
 """
+from base64 import b64encode
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
 from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import Mock, patch
+from urllib.parse import urlencode
+import json
 import tempfile
 import os
 
-from PIL import Image
+import msgpack
+from PIL import Image, features
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
 
 from core.models import (
+    ImageBlob,
     Recipe,
     Tag,
     Ingredient,
 )
 
+from recipe.export import iter_ndjson
+from recipe.pagination import RecipeCursorPagination
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
+    RecipeRowSerializer,
 )
 
 
 RECIPES_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk-create')
+EXPORT_URL = reverse('recipe:recipe-export')
+IMAGE_FORMATS = [('jpeg', 'JPEG')]
+if features.check('webp'):
+    IMAGE_FORMATS.append(('webp', 'WEBP'))
+
+
+def position_cursor(values):
+    """Return a cursor pointing after the given ordering values."""
+    query = urlencode({'p': json.dumps(values)})
+    return b64encode(query.encode()).decode()
 
 
 def detail_url(recipe_id):
@@ -59,6 +87,13 @@ def create_user(**params):
     return get_user_model().objects.create_user(**params)
 
 
+def count_queries(func, *args, **kwargs):
+    """Call func and return its result and the number of queries run."""
+    with CaptureQueriesContext(connection) as context:
+        result = func(*args, **kwargs)
+    return result, len(context.captured_queries)
+
+
 class PublicRecipeAPITests(TestCase):
     """Test unauthenticated API requests."""
 
@@ -95,7 +130,7 @@ class PrivateRecipeAPITest(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipe_list_limited_to_user(self):
         """Test list of recipes is limited to authenticated user."""
@@ -112,7 +147,7 @@ class PrivateRecipeAPITest(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_get_recipe_detail(self):
         """Test get recipe detail."""
@@ -282,6 +317,27 @@ class PrivateRecipeAPITest(TestCase):
             ).exists()
             self.assertTrue(exists)
 
+    def test_create_recipe_with_duplicate_tags(self):
+        """Test duplicate tag names in a payload create a single tag."""
+        payload = {
+            'title': 'Pancakes',
+            'time_minutes': 20,
+            'price': Decimal('3.20'),
+            'tags': [
+                {'name': 'Breakfast'},
+                {'name': 'Breakfast'},
+            ],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.tags.count(), 1)
+        self.assertEqual(
+            Tag.objects.filter(user=self.user, name='Breakfast').count(),
+            1,
+        )
+
     def test_create_tag_on_update(self):
         """Test create tag when updating a recipe."""
         recipe = create_recipe(user=self.user)
@@ -465,9 +521,9 @@ class PrivateRecipeAPITest(TestCase):
         s1 = RecipeSerializer(recipe1)
         s2 = RecipeSerializer(recipe2)
         s3 = RecipeSerializer(recipe3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
 
     def test_filter_by_ingredients(self):
         """Test filtering recipes by ingredients."""
@@ -493,9 +549,724 @@ class PrivateRecipeAPITest(TestCase):
         s3 = RecipeSerializer(recipe3)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
+
+    def test_list_paginated_by_cursor(self):
+        """Test following the cursor returns every recipe once."""
+        recipes = [create_recipe(user=self.user) for _ in range(5)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['previous'])
+        ids = [recipe['id'] for recipe in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(res.data['results']), 2)
+            ids.extend(recipe['id'] for recipe in res.data['results'])
+
+        self.assertEqual(ids, sorted([r.id for r in recipes], reverse=True))
+
+    def test_list_page_size_limited(self):
+        """Test the requested page size is capped by the maximum."""
+        for _ in range(3):
+            create_recipe(user=self.user)
+
+        with patch.object(RecipeCursorPagination, 'max_page_size', 2):
+            res = self.client.get(RECIPES_URL, {'page_size': 100})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNotNone(res.data['next'])
+
+    def test_list_pagination_does_not_count(self):
+        """Test paginating recipes does not count the collection."""
+        create_recipe(user=self.user)
+
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(RECIPES_URL, {'page_size': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        for query in context.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+
+    def test_filter_by_tags_match_all(self):
+        """Test match=all returns recipes having every listed tag."""
+        both = create_recipe(self.user, title='Salad')
+        one = create_recipe(self.user, title='Pizza')
+        tag1 = Tag.objects.create(user=self.user, name='Italian')
+        tag2 = Tag.objects.create(user=self.user, name='Healthy')
+        both.tags.add(tag1, tag2)
+        one.tags.add(tag1)
+
+        params = {'tags': f'{tag1.id},{tag2.id}', 'match': 'all'}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [recipe['id'] for recipe in res.data['results']], [both.id],
+        )
+
+    def test_filter_match_all_tags_and_ingredients(self):
+        """Test match=all applies to tags and ingredients together."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        pepper = Ingredient.objects.create(user=self.user, name='Pepper')
+        full = create_recipe(self.user)
+        full.tags.add(tag)
+        full.ingredients.add(salt, pepper)
+        untagged = create_recipe(self.user)
+        untagged.ingredients.add(salt, pepper)
+
+        params = {
+            'tags': f'{tag.id}',
+            'ingredients': f'{salt.id},{pepper.id},{salt.id}',
+            'match': 'all',
+        }
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual(
+            [recipe['id'] for recipe in res.data['results']], [full.id],
+        )
+
+    def test_filter_by_tags_without_join(self):
+        """Test tag filters use the id arrays and return each recipe once."""
+        recipe = create_recipe(self.user)
+        tags = [
+            Tag.objects.create(user=self.user, name=f'Tag{i}')
+            for i in range(3)
+        ]
+        recipe.tags.add(*tags)
+
+        params = {'tags': ','.join(str(tag.id) for tag in tags)}
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual(
+            [item['id'] for item in res.data['results']], [recipe.id],
+        )
+        recipe_queries = [
+            query['sql'] for query in ctx.captured_queries
+            if query['sql'].startswith('SELECT "core_recipe"')
+        ]
+        self.assertTrue(recipe_queries)
+        for sql in recipe_queries:
+            self.assertNotIn('DISTINCT', sql)
+            self.assertNotIn('core_recipe_tags', sql)
+            self.assertIn('"core_recipe"."tag_ids" &&', sql)
+
+    def test_filter_invalid_match(self):
+        """Test an unknown match mode returns bad request."""
+        res = self.client.get(RECIPES_URL, {'tags': '1', 'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_by_tags_paginated(self):
+        """Test paginating a list filtered by tags."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        tagged = []
+        for _ in range(3):
+            recipe = create_recipe(user=self.user)
+            recipe.tags.add(tag)
+            tagged.append(recipe.id)
+        create_recipe(user=self.user)
+
+        params = {'tags': f'{tag.id}', 'page_size': 2}
+        res = self.client.get(RECIPES_URL, params)
+        ids = [recipe['id'] for recipe in res.data['results']]
+        res = self.client.get(res.data['next'])
+        ids.extend(recipe['id'] for recipe in res.data['results'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['next'])
+        self.assertEqual(ids, sorted(tagged, reverse=True))
+
+    def test_list_invalid_cursor(self):
+        """Test an invalid cursor or cursor position returns not found."""
+        res = self.client.get(RECIPES_URL, {'cursor': 'invalid'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        for position in ('abc', '1.5', ''):
+            with self.subTest(position=position):
+                query = urlencode({'p': position})
+                cursor = b64encode(query.encode()).decode()
+
+                res = self.client.get(RECIPES_URL, {'cursor': cursor})
+
+                self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RecipeSearchTests(TestCase):
+    """Test full-text search of recipes."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+
+    def _search(self, **params):
+        """Return the ids of the recipes found with the params."""
+        res = self.client.get(RECIPES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [recipe['id'] for recipe in res.data['results']]
+
+    def test_search_tampered_cursor(self):
+        """Test a rank that is not a number returns not found."""
+        create_recipe(user=self.user, title='Curry')
+        for values in (['x', 1], [0.5, 'y'], [0.5]):
+            with self.subTest(values=values):
+                res = self.client.get(RECIPES_URL, {
+                    'search': 'curry', 'cursor': position_cursor(values),
+                })
+
+                self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_search_title_and_description(self):
+        """Test search matches stemmed words in title and description."""
+        in_title = create_recipe(self.user, title='Baked potatoes')
+        in_description = create_recipe(
+            self.user, title='Gratin', description='Thinly sliced potato.',
+        )
+        create_recipe(self.user, title='Pasta')
+        other_user = create_user(email='other@example.com', password='pw')
+        create_recipe(other_user, title='Potato salad')
+
+        ids = self._search(search='potato')
+
+        self.assertEqual(ids, [in_title.id, in_description.id])
+
+    def test_search_websearch_syntax(self):
+        """Test quoted phrases and negated words are supported."""
+        soup = create_recipe(self.user, title='Tomato soup')
+        create_recipe(self.user, title='Tomato salad with soup bowl')
+        create_recipe(self.user, title='Onion soup')
+
+        self.assertEqual(self._search(search='"tomato soup"'), [soup.id])
+        self.assertEqual(
+            len(self._search(search='soup -onion')), 2,
+        )
+
+    def test_search_combined_with_tags(self):
+        """Test search results can be filtered by tags."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        tagged = create_recipe(self.user, title='Lentil curry')
+        tagged.tags.add(tag)
+        create_recipe(self.user, title='Chicken curry')
+
+        ids = self._search(search='curry', tags=f'{tag.id}')
+
+        self.assertEqual(ids, [tagged.id])
+
+    def test_search_vector_follows_updates(self):
+        """Test updated titles are searchable."""
+        recipe = create_recipe(self.user, title='Pancakes')
+
+        res = self.client.patch(detail_url(recipe.id), {'title': 'Waffles'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._search(search='waffles'), [recipe.id])
+        self.assertEqual(self._search(search='pancakes'), [])
+
+    def test_search_paginated_by_rank(self):
+        """Test paginating search results keeps the relevance order."""
+        recipes = [
+            create_recipe(self.user, title=title, description='')
+            for title in [
+                'Rice', 'Rice rice', 'Rice rice rice', 'Fried rice',
+                'Rice pudding',
+            ]
+        ]
+
+        expected = self._search(search='rice', page_size=10)
+        ids = []
+        params = {'search': 'rice', 'page_size': 2}
+        res = self.client.get(RECIPES_URL, params)
+        while True:
+            ids.extend(recipe['id'] for recipe in res.data['results'])
+            if res.data['next'] is None:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(ids, expected)
+        self.assertEqual(sorted(ids), sorted(r.id for r in recipes))
+        self.assertEqual(ids[0], recipes[2].id)
+
+
+class RecipeSparseFieldsetTests(TestCase):
+    """Test selecting recipe fields with fields and expand."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(self.user, description='Slow cooked.')
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+
+    def test_list_selected_fields_only(self):
+        """Test fields limits the output and skips the tag prefetch."""
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(RECIPES_URL, {'fields': 'id,title,price'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [{
+            'id': self.recipe.id,
+            'title': self.recipe.title,
+            'price': '7.77',
+        }])
+        sql = '\n'.join(query['sql'] for query in ctx.captured_queries)
+        self.assertNotIn('core_tag', sql)
+        self.assertNotIn('core_ingredient', sql)
+        self.assertNotIn('"core_recipe"."description"', sql)
+
+    def test_empty_fields_selection(self):
+        """Test an empty fields selection returns empty objects."""
+        res = self.client.get(RECIPES_URL, {'fields': ''})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [{}])
+
+        res = self.client.get(detail_url(self.recipe.id), {'fields': ''})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {})
+
+    def test_list_expand_detail_fields(self):
+        """Test expand adds detail fields to the listed recipes."""
+        res = self.client.get(RECIPES_URL, {'expand': 'description'})
+
+        item = res.data['results'][0]
+        self.assertEqual(item['description'], 'Slow cooked.')
+        self.assertEqual(item['tags'][0]['name'], 'Vegan')
+        self.assertNotIn('image', item)
+
+    def test_retrieve_selected_fields(self):
+        """Test fields applies to the recipe detail."""
+        res = self.client.get(
+            detail_url(self.recipe.id), {'fields': 'title,tags'},
+        )
+
+        self.assertEqual(list(res.data), ['title', 'tags'])
+
+    def test_unknown_field_rejected(self):
+        """Test unknown field names return bad request."""
+        res = self.client.get(RECIPES_URL, {'fields': 'id,user'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_selected_fields(self):
+        """Test the export honours fields."""
+        res = self.client.get(EXPORT_URL, {'fields': 'id,title'})
+
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{'id': self.recipe.id, 'title': self.recipe.title}],
+        )
+
+
+class RecipeRowSerializerTests(TestCase):
+    """Test the row serializer of the recipe list."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ('Vegan', 'Quick')
+        ]
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        self.recipes = [
+            create_recipe(self.user, title='Soup', price=Decimal('2.50')),
+            create_recipe(
+                self.user, title='Pie', link='',
+                image_variants={'thumb': {'jpeg': 'uploads/thumb.jpg'}},
+            ),
+            create_recipe(self.user, title='Tea'),
+        ]
+        self.recipes[0].tags.add(*tags)
+        self.recipes[0].ingredients.add(ingredient)
+        self.recipes[1].tags.add(tags[1])
+
+    def _render(self, serializer_class, queryset, request, **context):
+        """Render a list of recipes as JSON."""
+        return JSONRenderer().render(serializer_class(
+            queryset, many=True, context={'request': request, **context},
+        ).data)
+
+    def test_rows_render_same_bytes_as_models(self):
+        """Test the row and model serializers render identical JSON."""
+        request = APIRequestFactory().get(RECIPES_URL)
+        recipes = Recipe.objects.order_by('-id')
+
+        self.assertEqual(
+            self._render(
+                RecipeRowSerializer,
+                recipes.values(*RecipeRowSerializer.row_fields()),
+                request,
+            ),
+            self._render(
+                RecipeSerializer,
+                recipes.prefetch_related('tags', 'ingredients'),
+                request,
+            ),
+        )
+
+    def test_list_selected_fields_match_models(self):
+        """Test listed fields match the model serializer output."""
+        fields = ['id', 'price', 'tags']
+        res = self.client.get(RECIPES_URL, {'fields': ','.join(fields)})
+
+        self.assertEqual(
+            JSONRenderer().render(res.data['results']),
+            self._render(
+                RecipeSerializer,
+                Recipe.objects.order_by('-id'),
+                res.wsgi_request,
+                fields=fields,
+            ),
+        )
+
+    def test_list_search_hides_rank(self):
+        """Test the search rank used for ordering is not listed."""
+        res = self.client.get(RECIPES_URL, {'search': 'soup'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            JSONRenderer().render(res.data['results']),
+            self._render(
+                RecipeSerializer, [self.recipes[0]], res.wsgi_request,
+            ),
+        )
+
+
+class RecipeContentNegotiationTests(TestCase):
+    """Test recipes are served and accepted as JSON and MessagePack."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        recipe = create_recipe(self.user, title='Crème brûlée')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Dessert'))
+
+    def test_list_json_matches_stdlib_renderer(self):
+        """Test the listed JSON is byte for byte the stdlib output."""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res['Content-Type'], 'application/json')
+        self.assertEqual(res.content, JSONRenderer().render(res.data))
+
+    def test_list_msgpack(self):
+        """Test MessagePack is returned when accepted."""
+        json_res = self.client.get(RECIPES_URL)
+
+        res = self.client.get(RECIPES_URL, HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(res.content), json_res.json())
+        self.assertNotEqual(res['ETag'], json_res['ETag'])
+
+    def test_create_recipe_from_msgpack(self):
+        """Test a recipe is created from a MessagePack body."""
+        payload = {
+            'title': 'Soup',
+            'time_minutes': 10,
+            'price': '2.50',
+            'tags': [{'name': 'Vegan'}],
+        }
+
+        res = self.client.post(
+            RECIPES_URL,
+            msgpack.packb(payload),
+            content_type='application/msgpack',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.price, Decimal('2.50'))
+        self.assertEqual(recipe.tags.get().name, 'Vegan')
+
+
+class RecipeBulkCreateTests(TestCase):
+    """Test creating recipes in bulk."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='test@example.com',
+            password='parola1234',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _payload(self, count):
+        """Return a bulk payload of count recipes sharing tag names."""
+        return [
+            {
+                'title': f'Recipe {i}',
+                'time_minutes': 10 + i,
+                'price': '5.50',
+                'description': f'Description {i}',
+                'tags': [{'name': 'Dinner'}, {'name': f'Tag {i}'}],
+                'ingredients': [{'name': 'Salt'}],
+            }
+            for i in range(count)
+        ]
+
+    def test_bulk_create(self):
+        """Test creating several recipes with tags and ingredients."""
+        dinner = Tag.objects.create(user=self.user, name='Dinner')
+        payload = self._payload(3)
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 3)
+        for item, data in zip(payload, res.data):
+            recipe = Recipe.objects.get(id=data['id'])
+            self.assertEqual(recipe.user, self.user)
+            self.assertEqual(recipe.title, item['title'])
+            self.assertEqual(recipe.description, item['description'])
+            self.assertEqual(
+                sorted(tag.name for tag in recipe.tags.all()),
+                sorted(tag['name'] for tag in item['tags']),
+            )
+            self.assertIn(dinner, recipe.tags.all())
+            self.assertEqual(len(data['ingredients']), 1)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 1)
+        self.assertFalse(Recipe.objects.stale_attr_ids().exists())
+        self.assertEqual(Tag.objects.repair_recipe_counts(), 0)
+        self.assertEqual(Ingredient.objects.repair_recipe_counts(), 0)
+
+    def test_bulk_create_queries_flat(self):
+        """Test bulk creating runs the same queries for any batch size."""
+        _, few = count_queries(
+            self.client.post, BULK_URL, self._payload(2), format='json',
+        )
+        Recipe.objects.all().delete()
+        Tag.objects.all().delete()
+        Ingredient.objects.all().delete()
+        _, many = count_queries(
+            self.client.post, BULK_URL, self._payload(20), format='json',
+        )
+
+        self.assertEqual(few, many)
+
+    def test_bulk_create_errors_per_item(self):
+        """Test invalid items are reported by position and nothing saved."""
+        payload = self._payload(3)
+        del payload[1]['title']
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(res.data), 3)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('title', res.data[1])
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(RECIPE_BULK_MAX_SIZE=2)
+    def test_bulk_create_size_limited(self):
+        """Test batches above the maximum size are rejected."""
+        res = self.client.post(BULK_URL, self._payload(3), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('non_field_errors', res.data)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_create_requires_list(self):
+        """Test a single object is rejected by the bulk endpoint."""
+        res = self.client.post(BULK_URL, self._payload(1)[0], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+
+class RecipeExportTests(TestCase):
+    """Test streaming recipe exports."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='test@example.com',
+            password='parola1234',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _read_lines(self, res):
+        """Return the decoded JSON lines of a streaming response."""
+        content = b''.join(res.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_export_ndjson(self):
+        """Test exporting recipes as one JSON object per line."""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        recipes = [create_recipe(user=self.user) for _ in range(3)]
+        recipes[0].tags.add(tag)
+        create_recipe(user=create_user(
+            email='other@example.com',
+            password='parola1234',
+        ))
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = self._read_lines(res)
+        expected = RecipeDetailSerializer(
+            Recipe.objects.filter(user=self.user).order_by('-id'),
+            many=True,
+        ).data
+        self.assertEqual(lines, json.loads(json.dumps(expected)))
+
+    def test_export_with_ndjson_accept_header(self):
+        """Test the export negotiates the NDJSON media type."""
+        create_recipe(user=self.user)
+
+        res = self.client.get(EXPORT_URL, HTTP_ACCEPT='application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self._read_lines(res)), 1)
+
+    def test_export_filtered(self):
+        """Test the export applies the tag filter."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(tag)
+        create_recipe(user=self.user)
+
+        res = self.client.get(EXPORT_URL, {'tags': f'{tag.id}'})
+
+        lines = self._read_lines(res)
+        self.assertEqual([line['id'] for line in lines], [recipe.id])
+
+    def test_export_queries_per_chunk(self):
+        """Test tags and ingredients are loaded once per chunk."""
+        for i in range(6):
+            recipe = create_recipe(user=self.user)
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f'T{i}'))
+        queryset = Recipe.objects.filter(user=self.user).order_by('-id')
+
+        lines, count = count_queries(
+            lambda: ''.join(iter_ndjson(queryset, chunk_size=3)).splitlines()
+        )
+
+        self.assertEqual(len(lines), 6)
+        # One cursor query, then a tag and an ingredient query per chunk.
+        self.assertEqual(count, 1 + 2 * 2)
+
+
+class RecipeConditionalGetTests(TestCase):
+    """Test ETag handling on recipe endpoints."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='test@example.com',
+            password='parola1234',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def test_list_not_modified(self):
+        """Test an unchanged list is answered without recipe queries."""
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        etag = res['ETag']
+
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        for query in context.captured_queries:
+            self.assertNotIn('core_recipe', query['sql'])
+
+    def test_detail_not_modified(self):
+        """Test an unchanged recipe detail returns not modified."""
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_depends_on_query(self):
+        """Test different query parameters get different ETags."""
+        res1 = self.client.get(RECIPES_URL)
+        res2 = self.client.get(RECIPES_URL, {'page_size': 1})
+
+        self.assertNotEqual(res1['ETag'], res2['ETag'])
+
+    def test_write_changes_etag(self):
+        """Test writing a recipe makes the previous ETag stale."""
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        self.client.patch(detail_url(self.recipe.id), {'title': 'New'})
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(res.data['results'][0]['title'], 'New')
+
+    def test_profile_update_keeps_version(self):
+        """Test saving a loaded user does not roll the version back."""
+        etag = self.client.get(RECIPES_URL)['ETag']
+        self.client.patch(detail_url(self.recipe.id), {'title': 'New'})
+
+        res = self.client.patch(reverse('user:me'), {'name': 'New name'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['title'], 'New')
+
+    def test_failed_write_keeps_etag(self):
+        """Test an invalid write does not change the ETag."""
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        res = self.client.post(RECIPES_URL, {'title': 'Missing fields'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_upload_image_changes_etag(self):
+        """Test uploading an image makes the previous ETag stale."""
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            img = Image.new('RGB', (10, 10))
+            img.save(image_file, format='JPEG')
+            image_file.seek(0)
+            self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': image_file},
+                format='multipart',
+            )
+        self.recipe.refresh_from_db()
+        self.recipe.image.delete()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_etag_per_user(self):
+        """Test users do not share ETags."""
+        etag = self.client.get(RECIPES_URL)['ETag']
+        other_user = create_user(
+            email='other@example.com',
+            password='parola1234',
+        )
+        self.client.force_authenticate(other_user)
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
 
 
 class ImageUploadTests(TestCase):
@@ -511,8 +1282,26 @@ class ImageUploadTests(TestCase):
         self.recipe = create_recipe(self.user)
 
     def tearDown(self):
+        self.recipe.refresh_from_db()
+        for files in self.recipe.image_variants.values():
+            for name in files.values():
+                default_storage.delete(name)
         self.recipe.image.delete()
 
+    def _upload_image(self, size=(10, 10)):
+        """Upload a JPEG of the given size and run commit callbacks."""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', size).save(image_file, format='JPEG')
+            image_file.seek(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                res = self.client.post(
+                    url, {'image': image_file}, format='multipart',
+                )
+
+        self.recipe.refresh_from_db()
+        return res
+
     def test_upload_image(self):
         """Test uploading an image to a recipe."""
         url = image_upload_url(self.recipe.id)
@@ -536,3 +1325,307 @@ class ImageUploadTests(TestCase):
         res = self.client.post(url, payload, format='multipart')
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_upload_image_generates_variants(self):
+        """Test resized WebP and JPEG variants are stored for an image."""
+        res = self._upload_image(size=(2000, 1000))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        variants = self.recipe.image_variants
+        self.assertEqual(set(variants), set(settings.RECIPE_IMAGE_VARIANTS))
+        for name, max_size in settings.RECIPE_IMAGE_VARIANTS.items():
+            for image_format, pil_format in IMAGE_FORMATS:
+                with Image.open(
+                    default_storage.path(variants[name][image_format]),
+                ) as img:
+                    self.assertEqual(img.format, pil_format)
+                    self.assertEqual(img.size, (max_size, max_size // 2))
+
+    @skipUnless(features.check('webp'), 'Pillow built without WebP.')
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_variant_format_follows_accept_header(self):
+        """Test WebP variants are returned only to clients accepting it."""
+        self._upload_image()
+        url = detail_url(self.recipe.id)
+
+        res_jpeg = self.client.get(url)
+        res_webp = self.client.get(
+            url, HTTP_ACCEPT='application/json, image/webp',
+        )
+
+        self.assertTrue(res_jpeg.data['image_variants']['thumb'].endswith(
+            '-thumb.jpg',
+        ))
+        self.assertTrue(res_webp.data['image_variants']['thumb'].endswith(
+            '-thumb.webp',
+        ))
+        self.assertNotEqual(res_jpeg['ETag'], res_webp['ETag'])
+
+    @override_settings(IMAGE_VARIANT_WORKERS=2)
+    def test_variants_rendered_in_worker_pool(self):
+        """Test variants are rendered by the pool and saved on completion."""
+        executor = Mock()
+
+        def submit(func, *args):
+            future = Future()
+            future.set_result(func(*args))
+            return future
+        executor.submit.side_effect = submit
+
+        with patch('recipe.images.get_executor', return_value=executor), \
+                patch('recipe.images.connection'):
+            self._upload_image()
+
+        executor.submit.assert_called_once()
+        self.assertEqual(set(self.recipe.image_variants), {
+            'thumb', 'medium', 'large',
+        })
+
+    @override_settings(IMAGE_VARIANT_WORKERS=2)
+    def test_broken_worker_pool_replaced(self):
+        """Test a broken pool is logged and replaced, not raised."""
+        broken = Mock()
+        broken.submit.side_effect = BrokenProcessPool()
+        executor = Mock()
+
+        def submit(func, *args):
+            future = Future()
+            future.set_result(func(*args))
+            return future
+        executor.submit.side_effect = submit
+
+        with patch('recipe.images._executor', broken), \
+                patch('recipe.images.ProcessPoolExecutor',
+                      return_value=executor), \
+                patch('recipe.images.connection'), \
+                self.assertLogs('recipe.images', 'ERROR'):
+            res = self._upload_image()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        broken.shutdown.assert_called_once_with(wait=False)
+        executor.submit.assert_called_once()
+        self.assertIn('thumb', self.recipe.image_variants)
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_new_image_releases_previous_files(self):
+        """Test files of a replaced image are deleted when unreferenced."""
+        self._upload_image()
+        blob = ImageBlob.objects.get(path=self.recipe.image.name)
+        first_files = blob.files()
+
+        self._upload_image(size=(20, 20))
+
+        self.assertFalse(
+            ImageBlob.objects.filter(path=first_files[0]).exists(),
+        )
+        for name in first_files:
+            self.assertFalse(default_storage.exists(name))
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_upload_existing_image_is_deduplicated(self):
+        """Test uploading known content reuses the stored image."""
+        self._upload_image()
+        other = create_recipe(self.user)
+        url = image_upload_url(other.id)
+
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (10, 10)).save(image_file, format='JPEG')
+            image_file.seek(0)
+            with patch('recipe.views.schedule_variants') as mock_schedule:
+                res = self.client.post(
+                    url, {'image': image_file}, format='multipart',
+                )
+
+        other.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(other.image.name, self.recipe.image.name)
+        self.assertEqual(other.image_variants, self.recipe.image_variants)
+        mock_schedule.assert_not_called()
+        blob = ImageBlob.objects.get(path=other.image.name)
+        self.assertEqual(blob.ref_count, 2)
+
+        other.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(default_storage.exists(blob.path))
+
+
+class RecipeQueryCountTests(TestCase):
+    """Test the number of queries run by recipe endpoints stays flat."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='test@example.com',
+            password='parola1234',
+        )
+        self.client.force_authenticate(self.user)
+        self.tags = [
+            Tag.objects.create(user=self.user, name=f'Tag{i}')
+            for i in range(5)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(user=self.user, name=f'Ingredient{i}')
+            for i in range(5)
+        ]
+
+    def _create_recipes(self, count, attrs_count):
+        """Create recipes with the given number of tags and ingredients."""
+        recipes = []
+        for _ in range(count):
+            recipe = create_recipe(user=self.user)
+            recipe.tags.add(*self.tags[:attrs_count])
+            recipe.ingredients.add(*self.ingredients[:attrs_count])
+            recipes.append(recipe)
+        return recipes
+
+    def test_list_queries_flat(self):
+        """Test listing recipes runs the same queries for any row count."""
+        self._create_recipes(1, 1)
+        res, few = count_queries(self.client.get, RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self._create_recipes(10, 5)
+        res, many = count_queries(self.client.get, RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(few, many)
+
+    def test_filtered_list_queries_flat(self):
+        """Test filtering recipes runs the same queries for any row count."""
+        params = {
+            'tags': f'{self.tags[0].id}',
+            'ingredients': f'{self.ingredients[0].id}',
+        }
+        self._create_recipes(1, 1)
+        res, few = count_queries(self.client.get, RECIPES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self._create_recipes(10, 5)
+        res, many = count_queries(self.client.get, RECIPES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(few, many)
+
+    def test_deep_page_queries_flat(self):
+        """Test a deep page runs the same queries as the first page."""
+        self._create_recipes(10, 2)
+
+        res, first = count_queries(
+            self.client.get, RECIPES_URL, {'page_size': 2},
+        )
+        for _ in range(3):
+            res = self.client.get(res.data['next'])
+        res, deep = count_queries(self.client.get, res.data['next'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertEqual(first, deep)
+
+    def test_detail_queries_flat(self):
+        """Test recipe detail runs the same queries for any tag count."""
+        small, large = self._create_recipes(1, 1) + self._create_recipes(1, 5)
+
+        res, few = count_queries(self.client.get, detail_url(small.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, many = count_queries(self.client.get, detail_url(large.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(few, many)
+
+    def test_update_queries_flat(self):
+        """Test updating a recipe runs the same queries for any tag count."""
+        small, large = self._create_recipes(1, 1) + self._create_recipes(1, 5)
+        payload = {'title': 'New title'}
+
+        res, few = count_queries(
+            self.client.patch, detail_url(small.id), payload,
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, many = count_queries(
+            self.client.patch, detail_url(large.id), payload,
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(few, many)
+
+    def test_create_with_nested_queries_flat(self):
+        """Test creating a recipe runs the same queries for any tag count."""
+        counts = []
+        for size in (1, 20):
+            payload = {
+                'title': f'Recipe with {size}',
+                'time_minutes': 10,
+                'price': Decimal('4.50'),
+                'tags': [{'name': f'New tag {i}'} for i in range(size)] + [
+                    {'name': tag.name} for tag in self.tags[:size]
+                ],
+                'ingredients': [
+                    {'name': f'New ingredient {i}'} for i in range(size)
+                ],
+            }
+            res, count = count_queries(
+                self.client.post, RECIPES_URL, payload, format='json',
+            )
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            counts.append(count)
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_update_with_nested_queries_flat(self):
+        """Test replacing recipe tags runs the same queries for any count."""
+        small, large = self._create_recipes(1, 1) + self._create_recipes(1, 5)
+
+        counts = []
+        for recipe, size in ((small, 1), (large, 20)):
+            payload = {
+                'tags': [{'name': f'Other tag {i}'} for i in range(size)],
+                'ingredients': [
+                    {'name': f'Other ingredient {i}'} for i in range(size)
+                ],
+            }
+            res, count = count_queries(
+                self.client.patch, detail_url(recipe.id), payload,
+                format='json',
+            )
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(recipe.tags.count(), size)
+            counts.append(count)
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_delete_queries_flat(self):
+        """Test deleting a recipe runs the same queries for any tag count."""
+        small, large = self._create_recipes(1, 1) + self._create_recipes(1, 5)
+
+        res, few = count_queries(self.client.delete, detail_url(small.id))
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        res, many = count_queries(self.client.delete, detail_url(large.id))
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+        self.assertEqual(few, many)
+
+    def test_upload_image_queries_flat(self):
+        """Test uploading an image runs the same queries for any tag count."""
+        small, large = self._create_recipes(1, 1) + self._create_recipes(1, 5)
+
+        counts = []
+        # Distinct content, so neither upload is deduplicated.
+        for recipe, color in ((small, 'black'), (large, 'white')):
+            with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+                img = Image.new('RGB', (10, 10), color)
+                img.save(image_file, format='JPEG')
+                image_file.seek(0)
+                res, count = count_queries(
+                    self.client.post,
+                    image_upload_url(recipe.id),
+                    {'image': image_file},
+                    format='multipart',
+                )
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            recipe.refresh_from_db()
+            recipe.image.delete()
+            counts.append(count)
+
+        self.assertEqual(counts[0], counts[1])
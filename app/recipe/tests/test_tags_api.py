@@ -1,9 +1,15 @@
 """
 Test for tags API.
 """
+from base64 import b64encode
 from decimal import Decimal
+from unittest.mock import patch
+from urllib.parse import urlencode
+import json
 
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.test import TestCase
 
@@ -12,6 +18,10 @@ from rest_framework.test import APIClient
 
 from core.models import Tag, Recipe
 
+from recipe.pagination import (
+    RecipeAttrCursorPagination,
+    RecipeAttrSearchCursorPagination,
+)
 from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
@@ -32,6 +42,12 @@ def create_recipe(user, **params):
     return recipe
 
 
+def position_cursor(values):
+    """Return a cursor pointing after the given ordering values."""
+    query = urlencode({'p': json.dumps(values)})
+    return b64encode(query.encode()).decode()
+
+
 def detail_url(tag_id):
     """Create and return a tag detail url."""
     return reverse('recipe:tag-detail', args=[tag_id])
@@ -74,7 +90,7 @@ class PrivateTagsApiTests(TestCase):
         serializer = TagSerializer(tags, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """Test list of tags is limited to auth user."""
@@ -85,9 +101,9 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
-        self.assertEqual(res.data[0]['id'], tag.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
+        self.assertEqual(res.data['results'][0]['id'], tag.id)
 
     def test_update_tag(self):
         """Test updating a tag."""
@@ -100,6 +116,17 @@ class PrivateTagsApiTests(TestCase):
         tag.refresh_from_db()
         self.assertEqual(tag.name, payload['name'])
 
+    def test_update_tag_duplicate_name_error(self):
+        """Test renaming a tag to an existing name returns an error."""
+        Tag.objects.create(user=self.user, name='Dinner')
+        tag = Tag.objects.create(user=self.user, name='Lunch')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'Dinner'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Lunch')
+
     def test_delete_tag(self):
         """Test deleting a tag."""
         tag = Tag.objects.create(user=self.user, name='Test Tag')
@@ -119,11 +146,12 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
+        tag1.refresh_from_db()
         s1 = TagSerializer(tag1)
         s2 = TagSerializer(tag2)
 
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
 
     def test_filter_tags_upique(self):
         """Test filtering tags returns a uique list."""
@@ -136,4 +164,169 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_filter_assigned_uses_semi_join(self):
+        """Test assigned_only is answered without DISTINCT."""
+        tag = Tag.objects.create(user=self.user, name='Tag1')
+        create_recipe(self.user).tags.add(tag)
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual(res.data['results'][0]['id'], tag.id)
+        sql = next(
+            query['sql'] for query in ctx.captured_queries
+            if query['sql'].startswith('SELECT "core_tag"')
+        )
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('DISTINCT', sql)
+
+    def test_tags_paginated_by_name_and_id(self):
+        """Test following the cursor returns every tag once in order."""
+        for name in ['Brunch', 'Vegan', 'Keto', 'Asian', 'Dinner']:
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['previous'])
+        ids = [tag['id'] for tag in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            ids.extend(tag['id'] for tag in res.data['results'])
+
+        expected = Tag.objects.order_by('-name', '-id')
+        self.assertEqual(ids, [tag.id for tag in expected])
+
+    def test_tags_previous_page(self):
+        """Test the previous cursor returns the preceding page."""
+        for name in ['Brunch', 'Vegan', 'Asian', 'Dinner']:
+            Tag.objects.create(user=self.user, name=name)
+
+        first = self.client.get(TAGS_URL, {'page_size': 2})
+        second = self.client.get(first.data['next'])
+        res = self.client.get(second.data['previous'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], first.data['results'])
+
+    def test_tags_page_size_limited(self):
+        """Test the requested page size is capped by the maximum."""
+        for name in ['Brunch', 'Vegan', 'Asian']:
+            Tag.objects.create(user=self.user, name=name)
+
+        with patch.object(RecipeAttrCursorPagination, 'max_page_size', 2):
+            res = self.client.get(TAGS_URL, {'page_size': 1000})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNotNone(res.data['next'])
+
+    def test_tags_invalid_cursor(self):
+        """Test a malformed cursor returns not found."""
+        res = self.client.get(TAGS_URL, {'cursor': 'cD1bMV0='})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tags_tampered_cursor(self):
+        """Test cursor values of the wrong type return not found."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        for values in (['a', 'b'], ['a', None], ['a', [1]], ['a', {}]):
+            with self.subTest(values=values):
+                res = self.client.get(
+                    TAGS_URL, {'cursor': position_cursor(values)},
+                )
+
+                self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tags_not_modified(self):
+        """Test an unchanged tag list returns not modified."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_tag_update_changes_etag(self):
+        """Test updating a tag makes the previous ETag stale."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        self.client.patch(detail_url(tag.id), {'name': 'Keto'})
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['name'], 'Keto')
+
+    def test_autocomplete_prefix_and_typo(self):
+        """Test q matches name prefixes and misspellings, closest first."""
+        chicken = Tag.objects.create(user=self.user, name='Chicken')
+        chickpea = Tag.objects.create(user=self.user, name='Chickpea curry')
+        Tag.objects.create(user=self.user, name='Vegan')
+        other_user = create_user(email='other@example.com')
+        Tag.objects.create(user=other_user, name='Chicken')
+
+        res = self.client.get(TAGS_URL, {'q': 'chic'})
+        names = [tag['name'] for tag in res.data['results']]
+        res_typo = self.client.get(TAGS_URL, {'q': 'chiken'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertCountEqual(names, [chicken.name, chickpea.name])
+        self.assertEqual(res_typo.data['results'][0]['id'], chicken.id)
+
+    def test_autocomplete_bounded(self):
+        """Test q returns at most the autocomplete page size."""
+        for i in range(5):
+            Tag.objects.create(user=self.user, name=f'Soup {i}')
+
+        with patch.object(RecipeAttrSearchCursorPagination, 'page_size', 3):
+            res = self.client.get(TAGS_URL, {'q': 'soup'})
+
+        self.assertEqual(len(res.data['results']), 3)
+        self.assertIsNotNone(res.data['next'])
+
+    def test_tags_sorted_by_recipe_count(self):
+        """Test sort=recipe_count lists the most used tags first."""
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ['Rare', 'Common', 'Unused', 'Frequent']
+        ]
+        for uses, tag in zip([1, 3, 0, 2], tags):
+            for _ in range(uses):
+                create_recipe(self.user).tags.add(tag)
+
+        res = self.client.get(TAGS_URL, {'sort': 'recipe_count'})
+        res_min = self.client.get(
+            TAGS_URL, {'sort': 'recipe_count', 'min_recipes': 2},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        results = res.data['results']
+        self.assertEqual(
+            [(tag['name'], tag['recipe_count']) for tag in results],
+            [('Common', 3), ('Frequent', 2), ('Rare', 1), ('Unused', 0)],
+        )
+        self.assertEqual(
+            [tag['name'] for tag in res_min.data['results']],
+            ['Common', 'Frequent'],
+        )
+
+    def test_tags_invalid_sort(self):
+        """Test an unknown sort returns bad request."""
+        res = self.client.get(TAGS_URL, {'sort': 'popularity'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tags_invalid_min_recipes(self):
+        """Test a min_recipes that is no count returns bad request."""
+        for value in ('x', '1.5', '-1'):
+            with self.subTest(value=value):
+                res = self.client.get(TAGS_URL, {'min_recipes': value})
+
+                self.assertEqual(
+                    res.status_code, status.HTTP_400_BAD_REQUEST,
+                )
+                self.assertIn('min_recipes', res.data)
@@ -1,6 +1,19 @@
 """
 Views for recipe APIs.
 """
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+    TrigramWordSimilarity,
+)
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, FloatField, OuterRef, Q
+from django.db.models.functions import Cast, Greatest
+from django.http import StreamingHttpResponse
+from django.utils.translation import gettext as _
+
 from drf_spectacular.utils import (
     extend_schema_view,
     extend_schema,
@@ -13,17 +26,42 @@ from rest_framework import (
     status,
 )
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
-
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 
+from core.authentication import CachedTokenAuthentication
 from core.models import (
+    RECIPE_ATTR_ID_FIELDS,
     Recipe,
     Tag,
     Ingredient,
 )
+from core.renderers import FastJSONRenderer
 from recipe import serializers
+from recipe.asynchronous import AsyncReadMixin
+from recipe.conditional import ConditionalGetMixin
+from recipe.export import iter_ndjson
+from recipe.images import schedule_variants
+from recipe.pagination import (
+    RecipeAttrCountCursorPagination,
+    RecipeAttrCursorPagination,
+    RecipeAttrSearchCursorPagination,
+    RecipeCursorPagination,
+    RecipeSearchCursorPagination,
+)
+from recipe.renderers import NDJSONRenderer
+
+
+def assigned_filter(model):
+    """Return a semi-join keeping tags or ingredients used by a recipe."""
+    for field in Recipe._meta.many_to_many:
+        if field.related_model is model:
+            column = f'{model._meta.model_name}_id'
+            return Exists(field.remote_field.through.objects.filter(
+                **{column: OuterRef('pk')}
+            ))
+    raise ValueError(f'Recipe has no links to {model.__name__}.')
 
 
 @extend_schema_view(
@@ -33,78 +71,323 @@ from recipe import serializers
                 'assigned_only',
                 OpenApiTypes.INT, enum=[0, 1],
                 description='Filter by items assigned to recipe.'
-            )
+            ),
+            OpenApiParameter(
+                'q',
+                OpenApiTypes.STR,
+                description=(
+                    'Autocomplete names similar to the text, closest '
+                    f'first, {settings.AUTOCOMPLETE_PAGE_SIZE} per page.'
+                ),
+            ),
+            OpenApiParameter(
+                'sort',
+                OpenApiTypes.STR, enum=['name', 'recipe_count'],
+                description=(
+                    'Order by descending name (default) or by the number '
+                    'of recipes using the item, most used first.'
+                ),
+            ),
+            OpenApiParameter(
+                'min_recipes',
+                OpenApiTypes.INT,
+                description='Filter by items used in at least N recipes.'
+            ),
         ]
     )
 )
 class BaserRecipeAttrVieWSet(
+        AsyncReadMixin,
+        ConditionalGetMixin,
         mixins.DestroyModelMixin,
         mixins.UpdateModelMixin,
         mixins.ListModelMixin,
         viewsets.GenericViewSet,):
     """Base view set for recipe attributes."""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeAttrCursorPagination
+    read_from_replica = True
+
+    @property
+    def paginator(self):
+        """Paginate on the requested ordering."""
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('q'):
+                self._paginator = RecipeAttrSearchCursorPagination()
+            elif self.request.query_params.get('sort') == 'recipe_count':
+                self._paginator = RecipeAttrCountCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
         """Filter queryset to authenticated user."""
         assigned_only = bool(
             int(self.request.query_params.get('assigned_only', 0))
         )
+        text = self.request.query_params.get('q')
+        sort = self.request.query_params.get('sort', 'name')
+        min_recipes = self.request.query_params.get('min_recipes')
+        if sort not in ('name', 'recipe_count'):
+            raise ValidationError(
+                {'sort': [_('Must be "name" or "recipe_count".')]}
+            )
         queryset = self.queryset
+        ordering = ['-name']
+        if sort == 'recipe_count':
+            ordering = ['-recipe_count', '-id']
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            queryset = queryset.filter(assigned_filter(queryset.model))
+        if min_recipes:
+            queryset = queryset.filter(
+                recipe_count__gte=self._min_recipes(min_recipes),
+            )
+        if text:
+            # Word similarity matches prefixes and similarity matches
+            # misspelt names, both through the trigram index.
+            queryset = queryset.filter(
+                Q(name__trigram_word_similar=text) |
+                Q(name__trigram_similar=text)
+            ).annotate(
+                similarity=Cast(
+                    Greatest(
+                        TrigramWordSimilarity(text, 'name'),
+                        TrigramSimilarity('name', text),
+                    ),
+                    FloatField(),
+                ),
+            )
+            ordering = ['-similarity', '-id']
         return queryset.filter(
             user=self.request.user
-        ).order_by('-name').distinct()
+        ).order_by(*ordering)
+
+    def _min_recipes(self, value):
+        """Return min_recipes as a count, 400 for anything else."""
+        try:
+            count = int(value)
+        except ValueError:
+            count = -1
+        if count < 0:
+            raise ValidationError(
+                {'min_recipes': [_('Must be a non-negative integer.')]}
+            )
+        return count
+
+    def perform_update(self, serializer):
+        """Update the object, rejecting names already used by the user."""
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            raise ValidationError(
+                {'name': [_('An item with this name already exists.')]}
+            )
+
+
+RECIPE_FILTER_PARAMETERS = [
+    OpenApiParameter(
+        'tags',
+        OpenApiTypes.STR,
+        description='Comma separated list of IDs to filter'
+    ),
+    OpenApiParameter(
+        'ingredients',
+        OpenApiTypes.STR,
+        description='Comma separated list of ingredient IDs to filter'
+    ),
+    OpenApiParameter(
+        'match',
+        OpenApiTypes.STR, enum=['any', 'all'],
+        description=(
+            'Return recipes with any (default) or all of the listed tags '
+            'and ingredients.'
+        ),
+    ),
+    OpenApiParameter(
+        'fields',
+        OpenApiTypes.STR,
+        description=(
+            'Comma separated list of the fields to return. Related tags and '
+            'ingredients are only loaded when requested.'
+        ),
+    ),
+    OpenApiParameter(
+        'expand',
+        OpenApiTypes.STR,
+        description=(
+            'Comma separated list of detail fields, such as description and '
+            'image, to add to the listed recipes.'
+        ),
+    ),
+    OpenApiParameter(
+        'search',
+        OpenApiTypes.STR,
+        description=(
+            'Full-text search on title and description. Results are '
+            'ordered by relevance.'
+        ),
+    ),
+]
 
 
 @extend_schema_view(
     list=extend_schema(
-        parameters=[
-            OpenApiParameter(
-                'tags',
-                OpenApiTypes.STR,
-                description='Comma separated list of IDs to filter'
-            ),
-            OpenApiParameter(
-                'ingredients',
-                OpenApiTypes.STR,
-                description='Comma separated list of ingredient IDs to filter'
-            )
-        ]
+        parameters=RECIPE_FILTER_PARAMETERS,
+        responses=serializers.RecipeSerializer(many=True),
     )
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    AsyncReadMixin, ConditionalGetMixin, viewsets.ModelViewSet,
+):
     """View for manage recipe APIs."""
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeCursorPagination
+    read_from_replica = True
+
+    def _params_to_list(self, name):
+        """Return the names in a comma separated parameter, or None."""
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        return [item for item in value.split(',') if item]
+
+    def get_selected_fields(self):
+        """Return the fields chosen with fields and expand, or None."""
+        if self.request.method not in SAFE_METHODS:
+            return None
+        fields = self._params_to_list('fields')
+        expand = self._params_to_list('expand')
+        if fields is None and expand is None:
+            return None
+
+        available = serializers.RecipeDetailSerializer.Meta.fields
+        unknown = set(fields or []).union(expand or []) - set(available)
+        if unknown:
+            raise ValidationError({'fields': [
+                _('Unknown fields: %(fields)s.') % {
+                    'fields': ', '.join(sorted(unknown)),
+                },
+            ]})
+
+        if fields is None:
+            fields = available
+            if self.action == 'list':
+                fields = serializers.RecipeSerializer.Meta.fields
+        return [
+            name for name in available
+            if name in fields or name in (expand or [])
+        ]
 
     def _params_to_ints(self, qs):
         """Convert a list of strings(separated by ",") to integers."""
         return [int(str_id) for str_id in qs.split(',')]
 
+    def _filter_related(self, queryset, field_name, ids, match):
+        """Filter recipes linked to any or all ids by their id arrays."""
+        lookup = 'contains' if match == 'all' else 'overlap'
+        return queryset.filter(**{
+            f'{RECIPE_ATTR_ID_FIELDS[field_name]}__{lookup}': ids,
+        })
+
+    @property
+    def paginator(self):
+        """Paginate search results by relevance."""
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('search'):
+                self._paginator = RecipeSearchCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def get_queryset(self):
         """Retrieve recipes for authenticated user."""
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        search = self.request.query_params.get('search')
+        match = self.request.query_params.get('match', 'any')
+        if match not in ('any', 'all'):
+            raise ValidationError({'match': [_('Must be "any" or "all".')]})
         queryset = self.queryset
+        ordering = ['-id']
         if tags:
             tag_id_list = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_id_list)
+            queryset = self._filter_related(
+                queryset, 'tags', tag_id_list, match,
+            )
         if ingredients:
             ing_id_list = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ing_id_list)
-        return queryset.filter(
+            queryset = self._filter_related(
+                queryset, 'ingredients', ing_id_list, match,
+            )
+        if search:
+            query = SearchQuery(
+                search, config='english', search_type='websearch',
+            )
+            # Ranks are compared as doubles by the pagination cursor.
+            queryset = queryset.filter(search_vector=query).annotate(
+                rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+            )
+            ordering = ['-rank', '-id']
+        queryset = queryset.filter(
             user=self.request.user,
-            ).order_by('-id').distinct()
+            ).order_by(*ordering)
+        if self.action in ('list', 'retrieve', 'export'):
+            queryset = self._load_selected_fields(queryset)
+        return queryset
+
+    def _load_selected_fields(self, queryset):
+        """Load only the columns and relations of the selected fields."""
+        selected = self.get_selected_fields()
+        related = [
+            name for name in ('tags', 'ingredients')
+            if selected is None or name in selected
+        ]
+        if self._uses_rows():
+            # Related fields are fetched per page by the row serializer.
+            return queryset.values(
+                *serializers.RecipeRowSerializer.row_fields(selected),
+                *queryset.query.annotations,
+            )
+        if selected is not None:
+            queryset = queryset.only('id', *[
+                name for name in selected if name not in related
+            ])
+        if self.action != 'export':
+            # The export prefetches one chunk at a time.
+            queryset = queryset.prefetch_related(*related)
+        return queryset
+
+    def _uses_rows(self):
+        """Whether the list is serialized from rows instead of models."""
+        selected = self.get_selected_fields()
+        return self.action == 'list' and (
+            selected is None or
+            set(selected) <= set(serializers.RecipeSerializer.Meta.fields)
+        )
+
+    def get_serializer_context(self):
+        """Pass the selected fields on to the serializer."""
+        context = super().get_serializer_context()
+        selected = self.get_selected_fields()
+        if selected is not None:
+            context['fields'] = selected
+        return context
+
+    def retrieve(self, request, *args, **kwargs):
+        """Retrieve a recipe unless the collection is unchanged."""
+        return self.conditional_response(
+            request, super().retrieve, *args, **kwargs,
+        )
 
     def get_serializer_class(self):
         """Returns the serializer class for request."""
-        if self.action == 'list':
-            return serializers.RecipeSerializer
+        if self._uses_rows():
+            return serializers.RecipeRowSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
 
@@ -114,6 +397,50 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Create a new recipe, for the specific user."""
         serializer.save(user=self.request.user)
 
+    @extend_schema(
+        request=serializers.RecipeDetailSerializer(many=True),
+        responses={201: serializers.RecipeDetailSerializer(many=True)},
+        description=(
+            'Create a list of recipes in one transaction. At most '
+            f'{settings.RECIPE_BULK_MAX_SIZE} recipes are accepted per '
+            'request. Errors are returned per item, in request order.'
+        ),
+    )
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk_create(self, request):
+        """Create a batch of recipes."""
+        serializer = self.get_serializer(data=request.data, many=True)
+
+        if serializer.is_valid():
+            serializer.save(user=self.request.user)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @extend_schema(
+        parameters=RECIPE_FILTER_PARAMETERS,
+        responses={(200, 'application/x-ndjson'): OpenApiTypes.STR},
+        description=(
+            'Stream every recipe matching the filters as newline-delimited '
+            'JSON, one recipe detail object per line.'
+        ),
+    )
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='export',
+        renderer_classes=[NDJSONRenderer, FastJSONRenderer],
+    )
+    def export(self, request):
+        """Export recipes as newline-delimited JSON."""
+        return StreamingHttpResponse(
+            iter_ndjson(
+                self.filter_queryset(self.get_queryset()),
+                context=self.get_serializer_context(),
+            ),
+            content_type=NDJSONRenderer.media_type,
+        )
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
         """Upload an image to recipe."""
@@ -121,7 +448,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(recipe, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            recipe = serializer.save()
+            if not recipe.image_variants:
+                schedule_variants(recipe.image.name)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,22 @@
+server {
+    listen ${LISTEN_PORT};
+
+    # Recipe images are stored under the hash of their content.
+    location /static/media/uploads/recipe {
+        alias /vol/static/media/uploads/recipe;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
+    location /static {
+        alias /vol/static;
+    }
+
+    location / {
+        proxy_pass              http://${APP_HOST}:${APP_PORT};
+        proxy_http_version      1.1;
+        proxy_set_header        Host $host;
+        proxy_set_header        X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_set_header        X-Forwarded-Proto $scheme;
+        client_max_body_size    10M;
+    }
+}
\ No newline at end of file
@@ -1,6 +1,12 @@
 server {
     listen ${LISTEN_PORT};
 
+    # Recipe images are stored under the hash of their content.
+    location /static/media/uploads/recipe {
+        alias /vol/static/media/uploads/recipe;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
     location /static {
         alias /vol/static;
     }
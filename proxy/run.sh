@@ -2,5 +2,13 @@
 
 set -e
 
-envsubst < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf
+if [ "$APP_SERVER" = "asgi" ]; then
+    template=/etc/nginx/asgi.conf.tpl
+else
+    template=/etc/nginx/default.conf.tpl
+fi
+
+# Only our variables, nginx ones such as $host are kept as they are.
+envsubst '${LISTEN_PORT} ${APP_HOST} ${APP_PORT}' \
+    < $template > /etc/nginx/conf.d/default.conf
 nginx -g 'daemon off;'
\ No newline at end of file
@@ -5,5 +5,12 @@ set -e
 python manage.py wait_for_db
 python manage.py collectstatic --noinput
 python manage.py migrate
+python manage.py createcachetable
 
-uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
\ No newline at end of file
+if [ "$APP_SERVER" = "asgi" ]; then
+    uvicorn app.asgi:application --host 0.0.0.0 --port 9000 --workers 4 \
+        --forwarded-allow-ips "*"
+else
+    uwsgi --socket :9000 --workers 4 --threads "${UWSGI_THREADS:-1}" \
+        --master --enable-threads --module app.wsgi
+fi
\ No newline at end of file